@@ -1,7 +1,11 @@
 # pos/admin.py - VERSIÓN COMPLETA CON BOTÓN FUNCIONAL
+from django import forms
 from django.contrib import admin
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Category, Supplier, Product, CashDrawerSession, Sale, SaleItem, Customer,SaleReturn, SaleReturnItem
+from .models import Category, Supplier, Product, CashDrawerSession, Sale, SaleItem, Customer,SaleReturn, SaleReturnItem, CheckoutQueueEntry, StockMovement, DailySalesSummary, ReportJob
+from .stock import disable_sharding, enable_sharding, get_available_stock, set_stock_level
+from .metrics import get_dashboard_metrics, parse_top_days
+from .reports import sales_breakdowns, sales_in_range, sales_page, sales_totals
 from django.db.models import Sum, Count
 from django.utils.html import format_html
 from django.template.response import TemplateResponse
@@ -43,24 +47,79 @@ class SupplierAdmin(admin.ModelAdmin):
     get_product_count.short_description = 'Productos'
 
 
+class ProductAdminForm(forms.ModelForm):
+    """
+    El campo stock muestra el disponible (snapshot + movimientos pendientes),
+    que es lo que el encargado cuenta. La copia oculta del valor mostrado
+    permite saber si lo editó aunque haya ventas entre que abre y guarda.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None and 'stock' in self.fields:
+            self.initial['stock'] = available_stock_of(self.instance)
+            self.fields['stock'].show_hidden_initial = True
+
+
+def available_stock_of(product):
+    """Disponible anotado por with_available_stock, o consultado si no viene anotado"""
+    if hasattr(product, 'available_stock'):
+        return product.available_stock
+    return get_available_stock([product.pk]).get(product.pk, 0)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
     list_display = ['name', 'sku', 'price', 'stock', 'category', 'supplier', 'get_stock_status']
-    list_filter = ['category', 'supplier']
+    list_filter = ['category', 'supplier', 'sharded_stock']
     search_fields = ['name', 'sku']
     list_editable = ['price', 'stock']
     list_per_page = 25
+    actions = ['enable_sharded_stock', 'disable_sharded_stock']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_available_stock()
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', ProductAdminForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        # Editar el stock registra un ajuste en el libro en lugar de pisar el snapshot
+        if change and 'stock' in form.fields:
+            counted = obj.stock
+            if 'stock' in form.changed_data and counted != available_stock_of(obj):
+                set_stock_level(obj, counted, user=request.user)
+            other_fields = [name for name in form.changed_data if name != 'stock']
+            if other_fields:
+                obj.save(update_fields=other_fields)
+            return
+        super().save_model(request, obj, form, change)
 
     def get_stock_status(self, obj):
-        if obj.stock == 0:
+        stock = obj.available_stock
+        if stock <= 0:
             return format_html('<span style="color: red; font-weight: bold;">❌ SIN STOCK</span>')
-        elif obj.stock < 10:
-            return format_html('<span style="color: orange; font-weight: bold;">⚠️ BAJO ({})</span>', obj.stock)
+        elif stock < 10:
+            return format_html('<span style="color: orange; font-weight: bold;">⚠️ BAJO ({})</span>', stock)
         else:
-            return format_html('<span style="color: green;">✅ {} unidades</span>', obj.stock)
+            return format_html('<span style="color: green;">✅ {} unidades</span>', stock)
 
     get_stock_status.short_description = 'Estado Stock'
 
+    @admin.action(description="Repartir stock por caja (productos muy vendidos)")
+    def enable_sharded_stock(self, request, queryset):
+        for product in queryset:
+            enable_sharding(product)
+        messages.success(request, f"Stock repartido en {queryset.count()} productos")
+
+    @admin.action(description="Volver a un único contador de stock")
+    def disable_sharded_stock(self, request, queryset):
+        for product in queryset:
+            disable_sharding(product)
+        messages.success(request, f"Stock unificado en {queryset.count()} productos")
+
 
 @admin.register(CashDrawerSession)
 class CashDrawerSessionAdmin(admin.ModelAdmin):
@@ -97,7 +156,17 @@ class SaleAdmin(admin.ModelAdmin):
     ]
     list_filter = ['payment_method', 'created_at']
     search_fields = ['id', 'cash_drawer_session__user__username']
-    readonly_fields = ['created_at']
+    # Importe, método y caja alimentan DailySalesSummary/ProductDailySales: las
+    # ventas se corrigen con devoluciones, aquí solo se puede cambiar el cliente
+    readonly_fields = [
+        'created_at', 'receipt_code', 'cash_drawer_session', 'total_amount', 'payment_method', 'idempotency_key'
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
     def get_user(self, obj):
         if obj.cash_drawer_session:
@@ -115,16 +184,69 @@ class SaleAdmin(admin.ModelAdmin):
 
 @admin.register(SaleItem)
 class SaleItemAdmin(admin.ModelAdmin):
-    list_display = ['sale', 'product_name', 'quantity', 'unit_price', 'get_subtotal']
+    list_display = ['sale', 'product_name', 'quantity', 'unit_price', 'unit_cost', 'get_subtotal']
     list_filter = ['sale__created_at']
     search_fields = ['product_name', 'sale__id']
 
+    # Solo lectura por lo mismo que SaleAdmin
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
     def get_subtotal(self, obj):
         return f"${obj.quantity * obj.unit_price:.2f}"
 
     get_subtotal.short_description = 'Subtotal'
 
 
+@admin.register(CheckoutQueueEntry)
+class CheckoutQueueEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'payment_method', 'status', 'sale', 'created_at', 'processed_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['idempotency_key', 'cart', 'sale', 'created_at', 'processed_at']
+    search_fields = ['idempotency_key', 'user__username']
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'start_date', 'end_date', 'status', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['watermark', 'file_path', 'error', 'created_at', 'started_at', 'finished_at']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['id', 'product', 'kind', 'quantity', 'sale', 'sale_return', 'created_by', 'created_at', 'applied']
+    list_filter = ['kind', 'applied', 'created_at']
+    search_fields = ['product__name', 'product__sku']
+    list_select_related = ['product', 'created_by']
+
+    def has_change_permission(self, request, obj=None):
+        return False  # El libro es solo de inserción
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySalesSummary)
+class DailySalesSummaryAdmin(admin.ModelAdmin):
+    list_display = ['date', 'payment_method', 'cashier', 'sale_count', 'total_amount', 'refund_count', 'refund_amount']
+    list_filter = ['payment_method', 'date']
+    list_select_related = ['cashier']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False  # Se mantiene desde checkout/devoluciones y rebuild_sales_summary
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ['name', 'tax_id', 'phone', 'email', 'created_at']
@@ -149,78 +271,8 @@ class CustomerAdmin(admin.ModelAdmin):
 @staff_member_required
 def pos_dashboard_view(request):
     """Dashboard completo para el admin"""
-    today = timezone.now().date()
-
-    # Métricas principales
-    today_sales = Sale.objects.filter(created_at__date=today).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-
-    today_transactions = Sale.objects.filter(created_at__date=today).count()
-    today_avg_ticket = today_sales / today_transactions if today_transactions > 0 else 0
-    active_sessions = CashDrawerSession.objects.filter(end_time__isnull=True).count()
-
-    # Métricas de la semana
-    week_ago = today - timezone.timedelta(days=7)
-    week_sales = Sale.objects.filter(created_at__date__gte=week_ago).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-
-    # Ventas por método de pago hoy
-    cash_sales_today = Sale.objects.filter(
-        created_at__date=today,
-        payment_method='cash'
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-
-    card_sales_today = Sale.objects.filter(
-        created_at__date=today,
-        payment_method='card'
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-
-    # Productos más vendidos
-    top_products = SaleItem.objects.values(
-        'product_name'
-    ).annotate(
-        total_sold=Sum('quantity'),
-        total_revenue=Sum('unit_price')
-    ).order_by('-total_sold')[:5]
-
-    # Sesiones de hoy
-    today_sessions = CashDrawerSession.objects.filter(
-        start_time__date=today
-    ).select_related('user')
-
-    # Ventas recientes
-    recent_sales = Sale.objects.select_related(
-        'cash_drawer_session',
-        'cash_drawer_session__user'
-    ).order_by('-created_at')[:10]
-
-    # Productos con stock bajo
-    low_stock_products = Product.objects.filter(stock__lt=10, stock__gt=0).order_by('stock')[:5]
-    out_of_stock_products = Product.objects.filter(stock=0)[:5]
-
     context = {
-        # Métricas principales
-        'today_sales': today_sales,
-        'today_transactions': today_transactions,
-        'today_avg_ticket': today_avg_ticket,
-        'active_sessions': active_sessions,
-
-        # Nuevas métricas
-        'week_sales': week_sales,
-        'cash_sales_today': cash_sales_today,
-        'card_sales_today': card_sales_today,
-
-        # Datos detallados
-        'top_products': top_products,
-        'today_sessions': today_sessions,
-        'recent_sales': recent_sales,
-        'low_stock_products': low_stock_products,
-        'out_of_stock_products': out_of_stock_products,
-        'today_date': today,
-        'week_ago': week_ago,
-
+        **get_dashboard_metrics(parse_top_days(request.GET.get('top_days'))),
         'title': '📊 Dashboard POS - Sistema de Punto de Venta',
     }
 
@@ -234,9 +286,10 @@ def pos_dashboard_view(request):
 @staff_member_required
 def sales_report_admin_view(request):
     """Reporte de ventas integrado en el admin"""
-    sales = Sale.objects.none()
-    total_sales = 0
-    total_transactions = 0
+    sales = []
+    totals = {'total_sales': 0, 'total_transactions': 0, 'average_ticket': 0}
+    breakdowns = []
+    next_cursor = None
     start_date = None
     end_date = None
 
@@ -249,152 +302,29 @@ def sales_report_admin_view(request):
                 start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-                # Filtrar ventas por rango de fechas
-                sales = Sale.objects.filter(
-                    created_at__date__range=[start_date, end_date]
-                ).select_related(
-                    'cash_drawer_session',
-                    'cash_drawer_session__user'
-                ).order_by('-created_at')
-
-                # Calcular totales
-                if sales.exists():
-                    total_sales_result = sales.aggregate(total=Sum('total_amount'))
-                    total_sales = total_sales_result['total'] or 0
-                    total_transactions = sales.count()
+                # Totales en un aggregate y solo la primera página de ventas
+                range_sales = sales_in_range(start_date, end_date)
+                totals = sales_totals(range_sales)
+                breakdowns = sales_breakdowns(range_sales)
+                sales, next_cursor = sales_page(range_sales)
 
             except ValueError:
                 messages.error(request, "Formato de fecha inválido")
 
     context = {
         'sales': sales,
-        'total_sales': total_sales,
-        'total_transactions': total_transactions,
+        **totals,
+        'next_cursor': next_cursor,
+        'breakdowns': breakdowns,
         'start_date': start_date,
         'end_date': end_date,
-        'today': timezone.now().date(),
+        'today': timezone.localdate(),
         'title': '📈 Reporte de Ventas - Admin',
     }
 
     return TemplateResponse(request, 'admin/sales_report.html', context)
 
 
-# =============================================================================
-# BOTÓN DEFINITIVO - INYECCIÓN DIRECTA EN HTML
-# =============================================================================
-
-class AdminConBoton(admin.ModelAdmin):
-    """Mixin que añade botón a todas las vistas del admin"""
-
-    def changelist_view(self, request, extra_context=None):
-        response = super().changelist_view(request, extra_context)
-        if hasattr(response, 'render'):
-            try:
-                response.render()
-                content = response.content.decode('utf-8')
-
-                # Botón HTML
-                boton_html = '''
-                <div style="background: #28a745; padding: 15px; margin: 20px 0; border-radius: 8px; text-align: center; border: 2px solid #218838; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                    <a href="/dashboard/" style="color: white; text-decoration: none; font-size: 16px; font-weight: bold; display: block;">
-                        📊 VOLVER AL DASHBOARD PRINCIPAL
-                    </a>
-                </div>
-                '''
-
-                # Insertar después del breadcrumb o antes del content-main
-                if 'id="content-main"' in content:
-                    content = content.replace(
-                        '<div id="content-main">',
-                        boton_html + '<div id="content-main">'
-                    )
-                    response.content = content.encode('utf-8')
-
-            except Exception as e:
-                print(f"Error inyectando botón: {e}")
-
-        return response
-
-
-# Aplicar a todos los modelos
-for model, model_admin in admin.site._registry.items():
-    if not hasattr(model_admin, 'changelist_view_original'):
-        model_admin.changelist_view_original = model_admin.changelist_view
-
-
-        def new_changelist_view(self, request, extra_context=None):
-            response = self.changelist_view_original(request, extra_context)
-            if hasattr(response, 'render'):
-                try:
-                    response.render()
-                    content = response.content.decode('utf-8')
-
-                    boton_html = '''
-                    <div style="background: #28a745; padding: 15px; margin: 20px 0; border-radius: 8px; text-align: center; border: 2px solid #218838;">
-                        <a href="/dashboard/" style="color: white; text-decoration: none; font-size: 16px; font-weight: bold; display: block;">
-                            📊 VOLVER AL DASHBOARD PRINCIPAL
-                        </a>
-                    </div>
-                    '''
-
-                    if 'id="content-main"' in content:
-                        content = content.replace(
-                            '<div id="content-main">',
-                            boton_html + '<div id="content-main">'
-                        )
-                        response.content = content.encode('utf-8')
-
-                except Exception:
-                    pass
-
-            return response
-
-
-        model_admin.changelist_view = new_changelist_view.__get__(model_admin, type(model_admin))
-
-# =============================================================================
-# BOTÓN ESPECÍFICO PARA EL ÍNDICE /admin/
-# =============================================================================
-
-original_index = admin.site.index
-
-
-def index_con_boton(request, extra_context=None):
-    """Índice del admin con botón"""
-    response = original_index(request, extra_context)
-
-    if hasattr(response, 'render'):
-        try:
-            response.render()
-            content = response.content.decode('utf-8')
-
-            boton_html = '''
-            <div style="background: #28a745; padding: 20px; margin: 0 0 30px 0; border-radius: 10px; text-align: center; border: 3px solid #218838; box-shadow: 0 4px 8px rgba(0,0,0,0.15);">
-                <a href="/dashboard/" style="color: white; text-decoration: none; font-size: 18px; font-weight: bold; display: block;">
-                    📊 VOLVER AL DASHBOARD PRINCIPAL
-                </a>
-                <p style="color: rgba(255,255,255,0.9); margin: 10px 0 0 0; font-size: 14px;">
-                    Regresar al panel principal del sistema POS
-                </p>
-            </div>
-            '''
-
-            # Insertar al inicio del contenido principal
-            if 'id="content-main"' in content:
-                content = content.replace(
-                    '<div id="content-main">',
-                    boton_html + '<div id="content-main">'
-                )
-                response.content = content.encode('utf-8')
-
-        except Exception as e:
-            print(f"Error en índice: {e}")
-
-    return response
-
-
-admin.site.index = index_con_boton
-
 # =============================================================================
 # CONFIGURACIÓN FINAL DEL ADMIN
 # =============================================================================
@@ -419,23 +349,6 @@ def custom_get_urls():
 admin.site.get_urls = custom_get_urls
 
 
-# =============================================================================
-# BOTÓN EN BASE_SITE.HTML (FALLBACK)
-# =============================================================================
-
-def get_admin_site_header():
-    """Header personalizado con botón"""
-    original_header = "🛒 Sistema POS - Administración"
-    boton_header = '''
-    <div style="float: right; margin-right: 20px;">
-        <a href="/dashboard/" style="color: white; text-decoration: none; background: #28a745; padding: 8px 15px; border-radius: 4px; font-size: 14px; font-weight: bold;">
-            📊 Dashboard Principal
-        </a>
-    </div>
-    '''
-    return format_html(original_header)
-
-
 @admin.register(SaleReturn)
 class SaleReturnAdmin(admin.ModelAdmin):
     list_display = ['id', 'original_sale', 'returned_at', 'total_refund', 'processed_by']
@@ -453,8 +366,3 @@ class SaleReturnItemAdmin(admin.ModelAdmin):
         return f"${obj.get_subtotal():.2f}"
 
     get_subtotal.short_description = 'Subtotal'
-
-
-# Forzar el header personalizado
-admin.site.site_header = get_admin_site_header()
-
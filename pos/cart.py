@@ -0,0 +1,176 @@
+# pos/cart.py
+from decimal import Decimal
+
+from django.db.models import F
+
+from .models import CartLine, Product
+
+
+class CartError(Exception):
+    """Error de validación al añadir productos al carrito"""
+
+
+def parse_scan(text):
+    """
+    Convierte 'SKU' o 'cantidad*SKU' en (sku, cantidad). Solo se separa si lo
+    que va antes del '*' es un número: un SKU que contenga '*' se lee entero.
+    """
+    text = text.strip()
+    quantity, separator, sku = text.partition('*')
+    quantity = quantity.strip()
+    if not separator or not quantity.isdigit():
+        return text, 1
+
+    quantity = int(quantity)
+    if quantity <= 0:
+        raise CartError("La cantidad debe ser mayor a cero")
+    sku = sku.strip()
+    if not sku:
+        raise CartError(f"Falta el SKU después de '{quantity}*'")
+    return sku, quantity
+
+
+def parse_scan_batch(lines):
+    """Agrupa varias lecturas ('SKU' o 'cantidad*SKU') en {sku: cantidad}"""
+    entries = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        sku, quantity = parse_scan(line)
+        entries[sku] = entries.get(sku, 0) + quantity
+    return entries
+
+
+class Cart:
+    """
+    Carrito del cajero guardado en CartLine.
+
+    Cada escaneo escribe solo la línea afectada (INSERT o UPDATE con F())
+    en lugar de re-serializar toda la sesión de Django.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _lines(self):
+        return CartLine.objects.filter(user=self.user)
+
+    def get_quantity(self, product_id):
+        """Cantidad actual de un producto en el carrito (0 si no está)"""
+        quantity = self._lines().filter(product_id=product_id).values_list('quantity', flat=True).first()
+        return quantity or 0
+
+    def add(self, product, quantity=1, current_quantity=None):
+        """Suma `quantity` unidades del producto y devuelve la cantidad resultante"""
+        if current_quantity is None:
+            current_quantity = self.get_quantity(product.id)
+
+        if current_quantity:
+            self._lines().filter(product_id=product.id).update(quantity=F('quantity') + quantity)
+        else:
+            CartLine.objects.create(
+                user=self.user,
+                product_id=product.id,
+                name=product.name,
+                sku=product.sku,
+                price=product.price,
+                quantity=quantity
+            )
+        return current_quantity + quantity
+
+    def add_batch(self, entries):
+        """
+        Añade {sku: cantidad} de una sola vez: una consulta para productos y
+        stock, otra para las cantidades ya en el carrito y un único upsert.
+        Si alguna línea no es válida no se añade ninguna.
+        """
+        products = {
+            product['sku']: product
+            for product in Product.objects.with_available_stock().filter(sku__in=list(entries))
+            .values('id', 'name', 'sku', 'price', 'available_stock')
+        }
+        missing = [sku for sku in entries if sku not in products]
+        if missing:
+            raise CartError(f"Producto no encontrado: {', '.join(missing)}")
+
+        current = dict(
+            self._lines().filter(product_id__in=[p['id'] for p in products.values()])
+            .values_list('product_id', 'quantity')
+        )
+
+        lines = []
+        for sku, quantity in entries.items():
+            product = products[sku]
+            new_quantity = current.get(product['id'], 0) + quantity
+            if new_quantity > product['available_stock']:
+                raise CartError(
+                    f"No hay suficiente stock de {product['name']}. Stock disponible: {product['available_stock']}"
+                )
+            lines.append(CartLine(
+                user=self.user,
+                product_id=product['id'],
+                name=product['name'],
+                sku=product['sku'],
+                price=product['price'],
+                quantity=new_quantity
+            ))
+
+        CartLine.objects.bulk_create(
+            lines,
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity']
+        )
+
+    def items(self):
+        """Líneas con el mismo formato que el antiguo carrito en sesión"""
+        return [
+            {
+                'product_id': line['product_id'],
+                'name': line['name'],
+                'sku': line['sku'],
+                'price': str(line['price']),
+                'quantity': line['quantity'],
+            }
+            for line in self._lines().values('product_id', 'name', 'sku', 'price', 'quantity')
+        ]
+
+    def clear(self):
+        self._lines().delete()
+
+    def discard_missing(self):
+        """Quita las líneas cuyo producto se borró (quedan con product=NULL)"""
+        self._lines().filter(product__isnull=True).delete()
+
+
+def load_cart_rows(items):
+    """
+    Une las líneas del carrito con sus productos usando un solo in_bulk.
+
+    Devuelve (filas, faltantes): las filas llevan el producto actual para
+    mostrar stock y marcan si el precio cambió desde que se escaneó; los
+    faltantes son líneas cuyo producto ya no existe.
+    """
+    products = Product.objects.with_available_stock().in_bulk(
+        [item['product_id'] for item in items if item['product_id'] is not None]
+    )
+    rows = []
+    missing = []
+
+    for item in items:
+        product = products.get(item['product_id'])
+        if product is None:
+            missing.append(item)
+            continue
+
+        rows.append({
+            'name': item['name'],
+            'sku': item['sku'],
+            'price': item['price'],
+            'quantity': item['quantity'],
+            'subtotal': float(item['price']) * item['quantity'],
+            'product_obj': product,  # Para acceder al stock en template
+            'price_changed': product.price != Decimal(item['price']),
+        })
+
+    return rows, missing
@@ -0,0 +1,65 @@
+# pos/cash_drawer.py
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .models import CashDrawerSession
+
+SESSION_KEY = 'pos_active_cash_drawer_session'
+
+
+def _from_cache(data):
+    """Reconstruye la sesión de caja guardada en la sesión de login sin consultar la BD"""
+    cash_session = CashDrawerSession(
+        id=data['id'],
+        user_id=data['user_id'],
+        start_time=parse_datetime(data['start_time']),
+        starting_balance=Decimal(data['starting_balance']),
+    )
+    cash_session._state.adding = False
+    cash_session._state.db = 'default'
+    return cash_session
+
+
+def remember_active_session(request, cash_session):
+    """Guarda la sesión de caja activa (o su ausencia) en la sesión de login"""
+    request._active_cash_drawer_session = cash_session
+    request.session[SESSION_KEY] = {
+        'id': cash_session.id,
+        'user_id': cash_session.user_id,
+        'start_time': cash_session.start_time.isoformat(),
+        'starting_balance': str(cash_session.starting_balance),
+        'checked_at': time.time(),
+    } if cash_session else {'id': None, 'checked_at': time.time()}
+
+
+def forget_active_session(request):
+    request.__dict__.pop('_active_cash_drawer_session', None)
+    request.session.pop(SESSION_KEY, None)
+
+
+def get_active_session(request, fresh=False):
+    """
+    Sesión de caja activa del usuario, resuelta una vez por petición y
+    guardada en la sesión de login. open/close_session_view la actualizan;
+    cada POS_CASH_SESSION_RECHECK segundos se vuelve a verificar en la BD
+    por si se cerró desde otro lugar (por ejemplo, el admin).
+    """
+    if not fresh and hasattr(request, '_active_cash_drawer_session'):
+        return request._active_cash_drawer_session
+
+    cached = request.session.get(SESSION_KEY)
+    recheck = getattr(settings, 'POS_CASH_SESSION_RECHECK', 60)
+    if not fresh and cached and time.time() - cached['checked_at'] < recheck:
+        cash_session = _from_cache(cached) if cached['id'] else None
+        request._active_cash_drawer_session = cash_session
+        return cash_session
+
+    cash_session = CashDrawerSession.objects.filter(
+        user=request.user,
+        end_time__isnull=True
+    ).first()
+    remember_active_session(request, cash_session)
+    return cash_session
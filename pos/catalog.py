@@ -0,0 +1,271 @@
+# pos/catalog.py
+import re
+import threading
+import time
+import unicodedata
+import heapq
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Product
+
+
+# Datos del catálogo que cambian poco; el stock NO se guarda aquí
+CachedProduct = namedtuple('CachedProduct', ['id', 'name', 'sku', 'price'])
+
+
+class SkuCache:
+    """
+    Caché LRU en memoria (por worker) de SKU -> producto.
+
+    Las señales de Product invalidan las entradas del worker local; el TTL
+    acota cuánto puede tardar otro worker en ver un cambio de catálogo.
+    """
+
+    def __init__(self, maxsize=5000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # sku -> (CachedProduct, expira_en)
+        self._skus_by_id = {}
+        self._lock = threading.Lock()
+
+    def get(self, sku):
+        """Devuelve el producto del SKU o lanza Product.DoesNotExist"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(sku)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(sku)
+                return entry[0]
+
+        row = Product.objects.filter(sku=sku).values_list('id', 'name', 'sku', 'price').first()
+        if row is None:
+            raise Product.DoesNotExist(f"No existe un producto con SKU {sku}")
+
+        product = CachedProduct(*row)
+        with self._lock:
+            self._entries[sku] = (product, now + self.ttl)
+            self._entries.move_to_end(sku)
+            self._skus_by_id[product.id] = sku
+            while len(self._entries) > self.maxsize:
+                old_sku, (old_product, _) = self._entries.popitem(last=False)
+                self._skus_by_id.pop(old_product.id, None)
+        return product
+
+    def invalidate(self, product_id):
+        """Elimina el producto de la caché (incluso si su SKU cambió)"""
+        with self._lock:
+            sku = self._skus_by_id.pop(product_id, None)
+            if sku is not None:
+                self._entries.pop(sku, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._skus_by_id.clear()
+
+
+sku_cache = SkuCache(
+    maxsize=getattr(settings, 'POS_SKU_CACHE_SIZE', 5000),
+    ttl=getattr(settings, 'POS_SKU_CACHE_TTL', 60),
+)
+
+
+def normalize(text):
+    """Minúsculas y sin tildes (Plátano -> platano)"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def words(text):
+    return re.findall(r'\w+', normalize(text))
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    """
+    Índice en memoria (por worker) de nombres y SKU para el buscador de la
+    caja: las búsquedas por teclazo no consultan la BD.
+
+    - Prefijos: lista ordenada de (palabra, id) recorrida con bisect.
+    - Difusa: trigramas -> ids, para errores de tipeo ("tomte" -> "tomate").
+
+    Las señales de Product actualizan solo el producto cambiado en el worker
+    local. Pasado el TTL (para ver cambios de otros workers) el índice se
+    reconstruye en un hilo aparte mientras las búsquedas siguen usando el
+    actual; solo la primera carga se hace dentro de la petición.
+    """
+
+    def __init__(self, ttl=300, min_similarity=0.5):
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self._products = {}  # id -> CachedProduct
+        self._sort_keys = {}  # id -> (sku normalizado, nombre normalizado)
+        self._words = []  # [(palabra, id)] ordenada
+        self._words_by_id = {}
+        self._trigrams = {}  # trigrama -> {id}
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._refreshing = False
+        self._pending = None  # [(id, CachedProduct o None)] recibidos durante una reconstrucción
+
+    def _add(self, product, keep_sorted=True):
+        product_words = sorted(set(words(product.name)) | set(words(product.sku)))
+        self._products[product.id] = product
+        self._sort_keys[product.id] = (normalize(product.sku), normalize(product.name))
+        self._words_by_id[product.id] = product_words
+        for word in product_words:
+            if keep_sorted:
+                insort(self._words, (word, product.id))
+            else:
+                self._words.append((word, product.id))
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, set()).add(product.id)
+
+    def _remove(self, product_id):
+        self._products.pop(product_id, None)
+        self._sort_keys.pop(product_id, None)
+        for word in self._words_by_id.pop(product_id, []):
+            position = bisect_left(self._words, (word, product_id))
+            if position < len(self._words) and self._words[position] == (word, product_id):
+                del self._words[position]
+            for trigram in trigrams(word):
+                ids = self._trigrams.get(trigram)
+                if ids is not None:
+                    ids.discard(product_id)
+                    if not ids:
+                        del self._trigrams[trigram]
+
+    def _load_rows(self):
+        return [CachedProduct(*row) for row in Product.objects.values_list('id', 'name', 'sku', 'price')]
+
+    def refresh(self):
+        """
+        Reconstruye el índice aparte y lo cambia de una vez bajo el lock. Los
+        cambios que lleguen por señales mientras tanto se reaplican sobre el
+        nuevo, así la foto leída de la BD no pisa una actualización posterior.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            fresh = ProductIndex(self.ttl, self.min_similarity)
+            for product in self._load_rows():
+                fresh._add(product, keep_sorted=False)
+            # Ordenar una vez es mucho más rápido que insertar de a uno
+            fresh._words.sort()
+
+            with self._lock:
+                for product_id, product in self._pending:
+                    fresh._remove(product_id)
+                    if product is not None:
+                        fresh._add(product)
+                self._products, self._sort_keys = fresh._products, fresh._sort_keys
+                self._words, self._words_by_id, self._trigrams = fresh._words, fresh._words_by_id, fresh._trigrams
+                self._expires_at = time.monotonic() + self.ttl
+        finally:
+            with self._lock:
+                self._pending = None
+                self._refreshing = False
+
+    def _ensure_loaded(self):
+        if not self._expires_at:
+            # Sin índice no se puede buscar: una sola carga y el resto la espera
+            with self._first_load:
+                if not self._expires_at:
+                    self.refresh()
+            return
+
+        if self._expires_at > time.monotonic():
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        threading.Thread(target=self._background_refresh, name='product-index-refresh', daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            # El hilo abrió su propia conexión a la BD
+            connection.close()
+
+    def _prefix_ids(self, prefix):
+        # Las palabras con ese prefijo quedan contiguas en la lista ordenada
+        start = bisect_left(self._words, (prefix,))
+        end = bisect_left(self._words, (prefix + '\U0010ffff',), start)
+        return {product_id for _, product_id in self._words[start:end]}
+
+    def search(self, text, limit=10):
+        """
+        Productos cuyo nombre o SKU tiene palabras que empiezan con cada palabra
+        buscada; si no hay ninguno, coincidencias difusas (errores de tipeo).
+        """
+        query_words = words(text)
+        if not query_words:
+            return []
+
+        self._ensure_loaded()
+        query = normalize(text.strip())
+        with self._lock:
+            matches = set.intersection(*(self._prefix_ids(word) for word in query_words))
+
+            def rank(product_id):
+                # SKU exacto, luego nombre que empieza con lo buscado, luego alfabético
+                sku, name = self._sort_keys[product_id]
+                return sku != query, not name.startswith(query), name
+
+            found = [self._products[product_id] for product_id in heapq.nsmallest(limit, matches, key=rank)]
+            if not found:
+                found = self._fuzzy(query_words)[:limit]
+        return found
+
+    def _fuzzy(self, query_words):
+        """Productos que comparten suficientes trigramas con las palabras buscadas"""
+        query_trigrams = set().union(*(trigrams(word) for word in query_words))
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+
+        scored = [
+            (count / len(query_trigrams), self._products[product_id])
+            for product_id, count in shared.items()
+            if count / len(query_trigrams) >= self.min_similarity
+        ]
+        scored.sort(key=lambda item: (-item[0], self._sort_keys[item[1].id][1]))
+        return [product for _, product in scored]
+
+    def update(self, product):
+        """Reemplaza un producto en el índice tras un cambio (señal post_save)"""
+        cached = CachedProduct(product.pk, product.name, product.sku, product.price)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product.pk, cached))
+            if not self._expires_at:
+                return  # todavía no se cargó: se leerá completo en la primera búsqueda
+            self._remove(product.pk)
+            self._add(cached)
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((product_id, None))
+            self._remove(product_id)
+
+    def clear(self):
+        with self._lock:
+            self._expires_at = 0
+
+
+product_index = ProductIndex(ttl=getattr(settings, 'POS_PRODUCT_INDEX_TTL', 300))
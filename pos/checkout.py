@@ -0,0 +1,193 @@
+# pos/checkout.py
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import CheckoutQueueEntry, Product, Sale, SaleItem
+from .stock import get_available_stock, maybe_compact_stock, record_movements, shard_for, take_from_shards
+from .live import publish_sale
+from .metrics import invalidate_dashboard_metrics
+from .summary import record_sale
+
+
+class CheckoutError(Exception):
+    """Error de negocio al finalizar una venta"""
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, product_name, available, requested):
+        self.product_name = product_name
+        self.available = available
+        self.requested = requested
+        super().__init__(
+            f"Stock insuficiente para {product_name}. Disponible: {available}, Solicitado: {requested}"
+        )
+
+
+def _group_cart_quantities(cart):
+    """Agrupa las líneas del carrito por producto conservando el orden"""
+    quantities = OrderedDict()
+    for item in cart:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def get_sale_by_idempotency_key(idempotency_key):
+    """Venta ya registrada con esa clave, o None"""
+    if not idempotency_key:
+        return None
+    return Sale.objects.filter(idempotency_key=idempotency_key).first()
+
+
+def process_checkout(cart, cash_drawer_session, payment_method='cash', customer=None, idempotency_key=None):
+    """
+    Registra una venta a partir del carrito con un número fijo de consultas:
+    un SELECT con id__in, un INSERT de la venta, un bulk_create de los items
+    y otro de los movimientos de stock. Las filas de Product solo se bloquean
+    al final, para re-verificar el stock justo antes de confirmar.
+
+    Si se indica `idempotency_key` y otra petición ya registró la venta con
+    esa clave, se devuelve la venta existente sin tocar el stock.
+    """
+    try:
+        return _create_sale(cart, cash_drawer_session, payment_method, customer, idempotency_key)
+    except IntegrityError:
+        existing = get_sale_by_idempotency_key(idempotency_key)
+        if existing is None:
+            raise
+        return existing
+
+
+def _create_sale(cart, cash_drawer_session, payment_method, customer, idempotency_key):
+    quantities = _group_cart_quantities(cart)
+
+    with transaction.atomic():
+        # Lee snapshot + movimientos pendientes en una consulta, sin bloquear:
+        # el descuento es un INSERT en el libro y se re-verifica al final
+        products = Product.objects.with_available_stock().filter(
+            sharded_stock=False
+        ).in_bulk(list(quantities))
+
+        # Productos repartidos: no se bloquea su fila, cada caja descuenta de su sub-contador
+        sharded_ids = [product_id for product_id in quantities if product_id not in products]
+        if sharded_ids:
+            products.update(Product.objects.filter(sharded_stock=True).in_bulk(sharded_ids))
+            sharded_ids = [product_id for product_id in sharded_ids if product_id in products]
+
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                raise CheckoutError("Un producto del carrito ya no existe")
+            if not product.sharded_stock and product.available_stock < quantity:
+                raise InsufficientStockError(product.name, product.available_stock, quantity)
+
+        shard = shard_for(cash_drawer_session.user_id if cash_drawer_session else 0)
+        for product_id in sharded_ids:
+            if not take_from_shards(product_id, quantities[product_id], shard):
+                available = get_available_stock([product_id]).get(product_id, 0)
+                raise InsufficientStockError(products[product_id].name, available, quantities[product_id])
+
+        total_amount = sum(Decimal(str(item['price'])) * item['quantity'] for item in cart)
+
+        sale = Sale.objects.create(
+            total_amount=total_amount,
+            cash_drawer_session=cash_drawer_session,
+            payment_method=payment_method,
+            customer=customer,
+            idempotency_key=idempotency_key or None
+        )
+
+        SaleItem.objects.bulk_create([
+            SaleItem(
+                sale=sale,
+                product=products[item['product_id']],
+                product_name=products[item['product_id']].name,
+                quantity=item['quantity'],
+                unit_price=item['price'],
+                unit_cost=products[item['product_id']].cost
+            )
+            for item in cart
+        ])
+
+        # El stock se descuenta insertando en el libro, sin escribir en Product
+        record_movements(
+            {product_id: -quantity for product_id, quantity in quantities.items()},
+            'sale',
+            sale=sale,
+            applied_ids=set(sharded_ids)
+        )
+
+        product_sales = {}
+        for item in cart:
+            units, revenue = product_sales.get(item['product_id'], (0, Decimal('0')))
+            product_sales[item['product_id']] = (
+                units + item['quantity'],
+                revenue + Decimal(str(item['price'])) * item['quantity']
+            )
+        record_sale(sale, product_sales)
+
+        # Re-verificación: si otra venta consumió el stock entre la lectura y la
+        # inserción, se revierte. El bloqueo (en orden de id, sin interbloqueos)
+        # se toma lo más tarde posible: dos ventas del mismo producto solo se
+        # esperan durante esta comprobación y el COMMIT, y la que espera ya ve
+        # los movimientos de la otra al leer el disponible.
+        ledger_ids = sorted(product_id for product_id in quantities if product_id not in sharded_ids)
+        if ledger_ids:
+            list(Product.objects.select_for_update().filter(pk__in=ledger_ids).order_by('pk').values_list('pk'))
+            if any(available < 0 for available in get_available_stock(ledger_ids).values()):
+                raise CheckoutError("El stock cambió durante la venta, intenta nuevamente")
+
+        transaction.on_commit(maybe_compact_stock)
+        transaction.on_commit(invalidate_dashboard_metrics)
+        transaction.on_commit(lambda: publish_sale(sale))
+
+    return sale
+
+
+def enqueue_checkout(cart, user, cash_drawer_session, payment_method, customer, idempotency_key):
+    """
+    Modo write-behind: guarda la venta en CheckoutQueueEntry con un solo
+    INSERT y responde al terminal; drain_checkout_queue la registra después.
+    Un reenvío con la misma clave devuelve la entrada ya encolada.
+    """
+    try:
+        with transaction.atomic():
+            return CheckoutQueueEntry.objects.create(
+                idempotency_key=idempotency_key,
+                user=user,
+                cash_drawer_session=cash_drawer_session,
+                customer=customer,
+                payment_method=payment_method,
+                cart=cart
+            )
+    except IntegrityError:
+        return CheckoutQueueEntry.objects.get(idempotency_key=idempotency_key)
+
+
+def drain_checkout_queue(limit=100):
+    """Registra las ventas pendientes en orden de llegada; devuelve cuántas procesó"""
+    entries = list(
+        CheckoutQueueEntry.objects.filter(status='pending')
+        .select_related('cash_drawer_session', 'customer')[:limit]
+    )
+
+    for entry in entries:
+        try:
+            entry.sale = process_checkout(
+                entry.cart,
+                entry.cash_drawer_session,
+                entry.payment_method,
+                entry.customer,
+                idempotency_key=entry.idempotency_key
+            )
+            entry.status = 'done'
+        except CheckoutError as e:
+            # Queda visible en el admin para que el encargado la resuelva
+            entry.status = 'failed'
+            entry.error = str(e)
+        entry.processed_at = timezone.now()
+        entry.save(update_fields=['sale', 'status', 'error', 'processed_at'])
+
+    return len(entries)
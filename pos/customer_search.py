@@ -0,0 +1,56 @@
+# pos/customer_search.py
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Customer
+
+FTS_TABLE = 'pos_customer_fts'
+SEARCH_LIMIT = 10
+
+
+def uses_fts():
+    """El índice FTS5 solo existe en SQLite (ver migración 0017_customer_fts)"""
+    return connection.vendor == 'sqlite'
+
+
+def fts_query(text):
+    """
+    Convierte lo que escribe el cajero en una consulta FTS5: cada palabra
+    como prefijo entre comillas y todas obligatorias. "ana pe" -> "ana"* "pe"*
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search_customers(text, limit=SEARCH_LIMIT):
+    """
+    Clientes que coinciden con `text` por prefijo de palabra en nombre, RUC o
+    email, los más relevantes primero (bm25, el nombre pesa más). Una consulta.
+    """
+    match = fts_query(text)
+    if not match:
+        return []
+
+    if not uses_fts():
+        return list(Customer.objects.filter(
+            Q(name__icontains=text) | Q(tax_id__icontains=text) | Q(email__icontains=text)
+        )[:limit])
+
+    return list(Customer.objects.raw(
+        f"SELECT pos_customer.* FROM {FTS_TABLE} "
+        f"JOIN pos_customer ON pos_customer.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 1.0), pos_customer.name "
+        f"LIMIT %s",
+        [match, limit]
+    ))
+
+
+def rebuild_customer_search():
+    """Reconstruye el índice desde pos_customer (por ejemplo, tras cargas con SQL directo)"""
+    if not uses_fts():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
@@ -0,0 +1,24 @@
+# pos/dates.py
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def day_start(date):
+    """Medianoche del día en la zona horaria configurada (TIME_ZONE)"""
+    return timezone.make_aware(datetime.combine(date, time.min), timezone.get_current_timezone())
+
+
+def date_range_q(field, start_date=None, end_date=None):
+    """
+    Filtro por días de calendario como rango semiabierto de fechas-hora:
+    start_date <= field < end_date + 1 día. A diferencia de `field__date`,
+    no envuelve la columna en una función y puede usar sus índices.
+    """
+    q = Q()
+    if start_date:
+        q &= Q(**{f'{field}__gte': day_start(start_date)})
+    if end_date:
+        q &= Q(**{f'{field}__lt': day_start(end_date + timedelta(days=1))})
+    return q
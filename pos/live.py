@@ -0,0 +1,106 @@
+# pos/live.py
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .metrics import get_dashboard_metrics
+
+SNAPSHOT_FIELDS = [
+    'today_sales', 'today_transactions', 'today_avg_ticket', 'active_sessions',
+    'week_sales', 'cash_sales_today', 'card_sales_today',
+]
+
+
+def format_event(event, data, retry=None):
+    """Mensaje en formato server-sent events"""
+    message = f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+    return f"retry: {retry}\n{message}" if retry else message
+
+
+def metrics_snapshot():
+    """Cifras del dashboard (sale de la caché compartida de métricas)"""
+    metrics = get_dashboard_metrics()
+    return {field: metrics[field] for field in SNAPSHOT_FIELDS}
+
+
+class MetricsBroadcaster:
+    """
+    Reparte eventos del dashboard a todas las conexiones SSE de este worker.
+
+    Cada evento se serializa una sola vez y se encola en cada conexión. Las
+    publicaciones llegan desde hilos síncronos (vistas, on_commit), por eso
+    se entregan con call_soon_threadsafe en el loop de cada conexión.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()  # (loop, queue)
+        self._lock = threading.Lock()
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, message)
+
+    @staticmethod
+    def _offer(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Conexión lenta: se descartan los deltas y se le manda una foto completa
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def stream(self):
+        """
+        Generador para StreamingHttpResponse: foto inicial, luego los deltas y
+        una foto nueva cada POS_DASHBOARD_STREAM_KEEPALIVE segundos sin eventos
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+        keepalive = getattr(settings, 'POS_DASHBOARD_STREAM_KEEPALIVE', 15)
+        try:
+            yield format_event('snapshot', await sync_to_async(metrics_snapshot)())
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    # Los deltas son de este worker: la foto periódica (de la caché
+                    # compartida) recoge las ventas de otros workers y procesos
+                    message = None
+                if message is None:
+                    message = format_event('snapshot', await sync_to_async(metrics_snapshot)())
+                yield message
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+metrics_broadcaster = MetricsBroadcaster()
+
+
+def publish_sale(sale):
+    """Delta de una venta confirmada; el navegador lo suma a sus cifras"""
+    if metrics_broadcaster.has_subscribers():
+        metrics_broadcaster.publish(format_event('sale', {
+            'amount': sale.total_amount,
+            'payment_method': sale.payment_method,
+        }))
+
+
+def publish_snapshot():
+    """Recalcula las cifras una vez y las manda a todos los dashboards conectados"""
+    if metrics_broadcaster.has_subscribers():
+        metrics_broadcaster.publish(format_event('snapshot', metrics_snapshot()))
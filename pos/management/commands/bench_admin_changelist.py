@@ -0,0 +1,62 @@
+# pos/management/commands/bench_admin_changelist.py
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from pos.models import Product
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide el tiempo de render de las páginas de listado del admin (no guarda datos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default='product,sale,saleitem,salereturn',
+                            help="Modelos de pos separados por coma")
+        parser.add_argument('--repeat', type=int, default=50, help="Peticiones por página")
+        parser.add_argument('--products', type=int, default=100, help="Productos de prueba a crear")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options['models'].split(','), options['repeat'], options['products'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, models, repeat, products):
+        Product.objects.bulk_create([
+            Product(name=f"Bench {i}", sku=f"__bench_admin_{i}__", price=Decimal('1.50'), stock=10)
+            for i in range(products)
+        ])
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(User.objects.create_superuser('__bench_admin__', password='x'))
+
+        pages = [('índice', reverse('admin:index'))] + [
+            (model, reverse(f'admin:pos_{model}_changelist')) for model in models
+        ]
+        self.stdout.write(f"{'página':>12} {'ms/página':>10} {'KB':>8} {'KB pico':>9}")
+        for name, url in pages:
+            client.get(url)  # calienta plantillas y consultas
+            start = time.perf_counter()
+            for _ in range(repeat):
+                response = client.get(url)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            tracemalloc.start()
+            client.get(url)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{name:>12} {elapsed_ms:>10.2f} {len(response.content) / 1024:>8.1f} {peak / 1024:>9.0f}"
+            )
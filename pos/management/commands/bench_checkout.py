@@ -0,0 +1,59 @@
+# pos/management/commands/bench_checkout.py
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from pos.checkout import process_checkout
+from pos.models import CashDrawerSession, Product
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide consultas y latencia del checkout según el tamaño del carrito (no guarda datos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,20,40', help="Tamaños de carrito separados por coma")
+        parser.add_argument('--repeat', type=int, default=20, help="Ventas por tamaño")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+
+        try:
+            with transaction.atomic():
+                self._run(sizes, repeat)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, sizes, repeat):
+        user = User.objects.create(username='__bench_checkout__')
+        session = CashDrawerSession.objects.create(user=user, starting_balance=0)
+        products = Product.objects.bulk_create([
+            Product(name=f"Bench {i}", sku=f"__bench_{i}__", price=Decimal('1.50'), stock=10 ** 6)
+            for i in range(max(sizes))
+        ])
+
+        self.stdout.write(f"{'líneas':>8} {'consultas':>10} {'ms/venta':>10}")
+        for size in sizes:
+            cart = [
+                {'product_id': p.id, 'name': p.name, 'sku': p.sku, 'price': str(p.price), 'quantity': 2}
+                for p in products[:size]
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                process_checkout(cart, session)
+            queries = len(ctx.captured_queries)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                process_checkout(cart, session)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            self.stdout.write(f"{size:>8} {queries:>10} {elapsed_ms:>10.2f}")
@@ -0,0 +1,69 @@
+# pos/management/commands/bench_excel_export.py
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from pos.models import CashDrawerSession, Sale
+from pos.reports import excel_report_response
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mide tiempo y memoria pico del reporte Excel según la cantidad de ventas (no guarda datos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help="Cantidades de ventas separadas por coma")
+        parser.add_argument('--memory', action='store_true',
+                            help="Medir memoria pico con tracemalloc (hace la exportación ~3 veces más lenta)")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+
+        try:
+            with transaction.atomic():
+                self._run(sizes, options['memory'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, sizes, trace_memory):
+        user = User.objects.create(username='__bench_excel__')
+        session = CashDrawerSession.objects.create(user=user, starting_balance=0)
+        start_date = end_date = timezone.localdate()
+
+        self.stdout.write(f"{'ventas':>10} {'segundos':>10} {'MB pico':>10} {'MB archivo':>11}")
+        created = 0
+        for size in sizes:
+            while created < size:
+                batch = min(50000, size - created)
+                Sale.objects.bulk_create([
+                    Sale(total_amount=Decimal('12.50'), cash_drawer_session=session,
+                         payment_method='cash' if index % 2 else 'card')
+                    for index in range(batch)
+                ], batch_size=5000)
+                created += batch
+            sales = Sale.objects.filter(cash_drawer_session=session).select_related(
+                'cash_drawer_session', 'cash_drawer_session__user'
+            ).order_by('-created_at')
+
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            response = excel_report_response(sales, start_date, end_date)
+            file_size = sum(len(chunk) for chunk in response.streaming_content)
+            elapsed = time.perf_counter() - start
+            peak = f"{tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f}" if trace_memory else '-'
+            tracemalloc.stop()
+            response.file_to_stream.close()  # response.close() cerraría la conexión (request_finished)
+
+            self.stdout.write(
+                f"{size:>10} {elapsed:>10.1f} {peak:>10} {file_size / 2 ** 20:>11.1f}"
+            )
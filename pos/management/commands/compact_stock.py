@@ -0,0 +1,22 @@
+# pos/management/commands/compact_stock.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos.stock import compact_stock_movements
+
+
+class Command(BaseCommand):
+    help = "Compacta los movimientos de stock pendientes en Product.stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Compactar periódicamente")
+        parser.add_argument('--interval', type=float, default=60, help="Segundos entre compactaciones")
+
+    def handle(self, *args, **options):
+        while True:
+            updated = compact_stock_movements()
+            self.stdout.write(f"{updated} productos actualizados")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
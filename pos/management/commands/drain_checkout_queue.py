@@ -0,0 +1,25 @@
+# pos/management/commands/drain_checkout_queue.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos.checkout import drain_checkout_queue
+
+
+class Command(BaseCommand):
+    help = "Registra las ventas en cola (POS_CHECKOUT_MODE='queued')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Seguir procesando indefinidamente")
+        parser.add_argument('--interval', type=float, default=0.5, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--batch', type=int, default=100, help="Entradas por lote")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = drain_checkout_queue(limit=options['batch'])
+            if processed:
+                self.stdout.write(f"{processed} ventas procesadas")
+            if not options['loop']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
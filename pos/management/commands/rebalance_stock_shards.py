@@ -0,0 +1,22 @@
+# pos/management/commands/rebalance_stock_shards.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos.stock import rebalance_stock_shards
+
+
+class Command(BaseCommand):
+    help = "Reparte en partes iguales los sub-contadores de los productos con stock repartido"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Rebalancear periódicamente")
+        parser.add_argument('--interval', type=float, default=30, help="Segundos entre rebalanceos")
+
+    def handle(self, *args, **options):
+        while True:
+            rebalanced = rebalance_stock_shards()
+            self.stdout.write(f"{rebalanced} productos rebalanceados")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+# pos/management/commands/rebuild_customer_search.py
+from django.core.management.base import BaseCommand
+
+from pos.customer_search import rebuild_customer_search
+from pos.models import Customer
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de clientes (FTS5) desde la tabla de clientes"
+
+    def handle(self, *args, **options):
+        if rebuild_customer_search():
+            self.stdout.write(f"Índice reconstruido con {Customer.objects.count()} clientes")
+        else:
+            self.stdout.write("La base de datos no es SQLite: la búsqueda de clientes no usa índice FTS5")
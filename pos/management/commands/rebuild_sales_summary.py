@@ -0,0 +1,20 @@
+# pos/management/commands/rebuild_sales_summary.py
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from pos.summary import rebuild_daily_summary, rebuild_product_sales
+
+
+class Command(BaseCommand):
+    help = "Recalcula el resumen diario de ventas y los contadores por producto desde las ventas y devoluciones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="Fecha inicial (AAAA-MM-DD)")
+        parser.add_argument('--end', type=date.fromisoformat, help="Fecha final (AAAA-MM-DD)")
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_summary(options['start'], options['end'])
+        self.stdout.write(f"{rows} filas de resumen generadas")
+        rows = rebuild_product_sales(options['start'], options['end'])
+        self.stdout.write(f"{rows} contadores por producto generados")
@@ -0,0 +1,26 @@
+# pos/management/commands/run_report_jobs.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos.reports import run_pending_report_jobs
+
+
+class Command(BaseCommand):
+    help = "Genera los reportes en cola (POS_REPORT_MODE='queued', el modo por defecto) en un pool de procesos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Seguir procesando indefinidamente")
+        parser.add_argument('--interval', type=float, default=2, help="Segundos de espera cuando la cola está vacía")
+        parser.add_argument('--workers', type=int, default=2, help="Procesos generando reportes en paralelo")
+        parser.add_argument('--batch', type=int, default=10, help="Reportes por lote")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = run_pending_report_jobs(limit=options['batch'], workers=options['workers'])
+            if processed:
+                self.stdout.write(f"{processed} reportes generados")
+            if not options['loop']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,67 @@
+# pos/margins.py
+from django.db.models import DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .dates import date_range_q
+from .models import SaleItem
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+MARGIN_GROUPS = [
+    # (título, columna, campo de agrupación, campo con el nombre)
+    ('Por producto', 'Producto', 'product', 'product__name'),
+    ('Por categoría', 'Categoría', 'product__category', 'product__category__name'),
+    ('Por proveedor', 'Proveedor', 'product__supplier', 'product__supplier__name'),
+]
+
+# Las líneas anteriores a la foto de costo usan el costo actual del producto
+LINE_COST = Coalesce('unit_cost', 'product__cost')
+HAS_COST = Q(unit_cost__isnull=False) | Q(product__cost__isnull=False)
+
+# Unidades vendidas menos las devueltas (las devoluciones reembolsan unit_price)
+NET_QUANTITY = F('quantity') - F('returned_quantity')
+
+MARGIN_AGGREGATES = {
+    'units': Sum(NET_QUANTITY),
+    'revenue': Sum(NET_QUANTITY * F('unit_price'), output_field=MONEY),
+    'costed_revenue': Sum(NET_QUANTITY * F('unit_price'), filter=HAS_COST, output_field=MONEY),
+    'cost': Sum(NET_QUANTITY * LINE_COST, filter=HAS_COST, output_field=MONEY),
+}
+
+
+def _with_margin(row):
+    """Completa margen y % sobre las ventas con costo conocido; el resto va aparte"""
+    revenue = row['revenue'] or 0
+    costed_revenue = row['costed_revenue'] or 0
+    cost = row['cost'] or 0
+    row.update(
+        units=row['units'] or 0,
+        revenue=revenue,
+        cost=cost,
+        margin=costed_revenue - cost,
+        margin_percent=(costed_revenue - cost) / costed_revenue * 100 if costed_revenue else None,
+        uncosted_revenue=revenue - costed_revenue,
+    )
+    return row
+
+
+def margin_report(start_date, end_date):
+    """
+    Margen bruto del periodo total y por producto, categoría y proveedor.
+    Cada sección es un GROUP BY en la BD sobre SaleItem, así que el costo
+    depende de la cantidad de grupos que se devuelven, no de las líneas.
+    Las unidades devueltas se descuentan de la venta original, en su periodo.
+    Devuelve {'totals': fila, 'groups': [(título, columna, filas)]}.
+    """
+    items = SaleItem.objects.filter(date_range_q('sale__created_at', start_date, end_date)).order_by()
+
+    groups = []
+    for title, column, key, name in MARGIN_GROUPS:
+        rows = [
+            _with_margin({'label': row[name] or "Sin asignar", **row})
+            for row in items.values(key, name).annotate(**MARGIN_AGGREGATES)
+        ]
+        rows.sort(key=lambda row: row['margin'], reverse=True)
+        groups.append((title, column, rows))
+
+    return {'totals': _with_margin(items.aggregate(**MARGIN_AGGREGATES)), 'groups': groups}
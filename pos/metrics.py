@@ -0,0 +1,84 @@
+# pos/metrics.py
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .dates import date_range_q
+from .models import CashDrawerSession, Product, Sale
+from .summary import get_sales_totals, get_top_products
+
+CACHE_KEY = 'pos:dashboard_metrics:{date}:{top_days}'
+
+# Ventanas (en días) seleccionables para los productos más vendidos
+TOP_PRODUCT_WINDOWS = {1: 'Hoy', 7: '7 días', 30: '30 días', 365: '1 año'}
+DEFAULT_TOP_DAYS = 7
+
+
+def parse_top_days(value):
+    """Ventana pedida en la URL (?top_days=) o la de por defecto si no es válida"""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_TOP_DAYS
+    return days if days in TOP_PRODUCT_WINDOWS else DEFAULT_TOP_DAYS
+
+
+def _compute_dashboard_metrics(today, top_days):
+    week_ago = today - timezone.timedelta(days=7)
+
+    # Métricas de ventas en un solo aggregate sobre el resumen diario
+    totals = get_sales_totals(today, week_ago)
+    today_transactions = totals['today_transactions']
+
+    return {
+        # Métricas principales
+        'today_sales': totals['today_sales'],
+        'today_transactions': today_transactions,
+        'today_avg_ticket': totals['today_sales'] / today_transactions if today_transactions > 0 else 0,
+        'active_sessions': CashDrawerSession.objects.filter(end_time__isnull=True).count(),
+
+        # Nuevas métricas
+        'week_sales': totals['week_sales'],
+        'cash_sales_today': totals['cash_sales_today'],
+        'card_sales_today': totals['card_sales_today'],
+
+        # Datos detallados (se evalúan aquí para poder guardarlos en la caché)
+        'top_products': get_top_products(top_days, today=today),
+        'top_days': top_days,
+        'top_product_windows': TOP_PRODUCT_WINDOWS,
+        'today_sessions': list(CashDrawerSession.objects.filter(
+            date_range_q('start_time', today, today)
+        ).select_related('user')),
+        'recent_sales': list(Sale.objects.select_related(
+            'cash_drawer_session',
+            'cash_drawer_session__user'
+        ).order_by('-created_at')[:10]),
+        'low_stock_products': list(Product.objects.with_available_stock().filter(
+            available_stock__lt=10, available_stock__gt=0
+        ).order_by('available_stock')[:5]),
+        'out_of_stock_products': list(
+            Product.objects.with_available_stock().filter(available_stock__lte=0)[:5]
+        ),
+        'today_date': today,
+        'week_ago': week_ago,
+    }
+
+
+def get_dashboard_metrics(top_days=DEFAULT_TOP_DAYS):
+    """
+    Métricas de los dashboards (admin_dashboard y el del admin), guardadas en
+    la caché de Django durante POS_DASHBOARD_CACHE_TTL segundos. Checkout y
+    devoluciones invalidan la entrada al confirmar la transacción.
+    """
+    today = timezone.localdate()
+    key = CACHE_KEY.format(date=today, top_days=top_days)
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = _compute_dashboard_metrics(today, top_days)
+        cache.set(key, metrics, getattr(settings, 'POS_DASHBOARD_CACHE_TTL', 15))
+    return metrics
+
+
+def invalidate_dashboard_metrics():
+    today = timezone.localdate()
+    cache.delete_many([CACHE_KEY.format(date=today, top_days=days) for days in TOP_PRODUCT_WINDOWS])
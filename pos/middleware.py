@@ -1,6 +1,6 @@
 from django.shortcuts import redirect
 from django.urls import reverse
-from .models import CashDrawerSession
+from .cash_drawer import get_active_session
 
 
 class CashDrawerMiddleware:
@@ -25,13 +25,8 @@ class CashDrawerMiddleware:
             if (request.path.startswith('/pos/') and
                     not any(request.path.startswith(path) for path in excluded_paths)):
 
-                # Verificar si tiene una sesión de caja activa
-                has_active_session = CashDrawerSession.objects.filter(
-                    user=request.user,
-                    end_time__isnull=True
-                ).exists()
-
-                if not has_active_session:
+                # Verificar si tiene una sesión de caja activa (queda en request para las vistas)
+                if not get_active_session(request):
                     # Redirigir a apertura de caja si no tiene sesión activa
                     return redirect('open_session')
 
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2025-10-14 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0002_alter_sale_cash_drawer_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Nombre o Razón Social')),
+                ('tax_id', models.CharField(blank=True, max_length=20, verbose_name='RUC / Cédula')),
+                ('phone', models.CharField(blank=True, max_length=20, verbose_name='Teléfono')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='Email')),
+                ('address', models.TextField(blank=True, verbose_name='Dirección')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de registro')),
+            ],
+            options={
+                'verbose_name': 'Cliente',
+                'verbose_name_plural': 'Clientes',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.customer', verbose_name='Cliente'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2025-10-14 19:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0003_customer_sale_customer'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cashdrawersession',
+            options={'verbose_name': 'Sesión de Caja', 'verbose_name_plural': 'Sesiones de Caja'},
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2025-10-16 15:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0004_alter_cashdrawersession_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleReturn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('returned_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Devolución')),
+                ('reason', models.TextField(blank=True, verbose_name='Motivo de la Devolución')),
+                ('total_refund', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Total Reembolsado')),
+                ('original_sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pos.sale', verbose_name='Venta Original')),
+                ('processed_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='Procesado por')),
+            ],
+            options={
+                'verbose_name': 'Devolución',
+                'verbose_name_plural': 'Devoluciones',
+                'ordering': ['-returned_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleReturnItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Cantidad Devuelta')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Precio Unitario')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='pos.product', verbose_name='Producto')),
+                ('return_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='return_items', to='pos.salereturn')),
+            ],
+            options={
+                'verbose_name': 'Item de Devolución',
+                'verbose_name_plural': 'Items de Devolución',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0006_cartline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Clave de idempotencia'),
+        ),
+        migrations.CreateModel(
+            name='CheckoutQueueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True, verbose_name='Clave de idempotencia')),
+                ('payment_method', models.CharField(choices=[('cash', 'Efectivo'), ('card', 'Tarjeta')], default='cash', max_length=10)),
+                ('cart', models.JSONField(verbose_name='Carrito')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('done', 'Registrada'), ('failed', 'Fallida')], db_index=True, default='pending', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('cash_drawer_session', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='pos.cashdrawersession', verbose_name='Sesión de Caja')),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.customer', verbose_name='Cliente')),
+                ('sale', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.sale', verbose_name='Venta')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='Cajero')),
+            ],
+            options={
+                'verbose_name': 'Venta en Cola',
+                'verbose_name_plural': 'Ventas en Cola',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0007_sale_idempotency_key_checkoutqueueentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Cantidad')),
+                ('kind', models.CharField(choices=[('sale', 'Venta'), ('return', 'Devolución'), ('adjustment', 'Ajuste')], max_length=10, verbose_name='Tipo')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied', models.BooleanField(default=False, verbose_name='Compactado')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Registrado por')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='pos.product', verbose_name='Producto')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.sale', verbose_name='Venta')),
+                ('sale_return', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.salereturn', verbose_name='Devolución')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'ordering': ['-id'],
+                'indexes': [models.Index(condition=models.Q(('applied', False)), fields=['product'], name='stockmovement_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0009_stockshard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashdrawersession',
+            index=models.Index(condition=models.Q(('end_time__isnull', True)), fields=['user'], name='cashdrawer_open_by_user_idx'),
+        ),
+    ]
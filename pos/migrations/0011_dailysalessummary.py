@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0010_cashdrawersession_open_by_user_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('payment_method', models.CharField(choices=[('cash', 'Efectivo'), ('card', 'Tarjeta')], max_length=10, verbose_name='Método de Pago')),
+                ('sale_count', models.PositiveIntegerField(default=0, verbose_name='Ventas')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Vendido')),
+                ('refund_count', models.PositiveIntegerField(default=0, verbose_name='Devoluciones')),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Reembolsado')),
+                ('cashier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Cajero')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Ventas',
+                'verbose_name_plural': 'Resúmenes Diarios de Ventas',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'payment_method', 'cashier'), name='unique_daily_sales_summary')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0012_productdailysales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('excel', 'Excel'), ('pdf', 'PDF')], max_length=10, verbose_name='Formato')),
+                ('start_date', models.DateField(verbose_name='Fecha Inicial')),
+                ('end_date', models.DateField(verbose_name='Fecha Final')),
+                ('watermark', models.CharField(max_length=64, verbose_name='Marca de datos')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'Generando'), ('done', 'Listo'), ('failed', 'Fallido')], db_index=True, default='pending', max_length=10)),
+                ('file_path', models.CharField(blank=True, max_length=255, verbose_name='Archivo')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Reporte en Segundo Plano',
+                'verbose_name_plural': 'Reportes en Segundo Plano',
+                'ordering': ['-id'],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'start_date', 'end_date', 'watermark'), name='unique_report_artifact')],
+            },
+        ),
+    ]
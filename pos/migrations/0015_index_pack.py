@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0014_sale_created_at_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashdrawersession',
+            index=models.Index(fields=['user', 'end_time'], name='cashdrawer_user_end_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['created_at', 'payment_method'], name='sale_created_at_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(fields=['product', 'sale'], name='saleitem_product_sale_idx'),
+        ),
+    ]
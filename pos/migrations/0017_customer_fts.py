@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# Índice FTS5 de contenido externo: guarda solo el índice invertido y lee
+# las columnas de pos_customer. Los triggers lo mantienen al día.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE pos_customer_fts USING fts5(
+        name, tax_id, email,
+        content='pos_customer', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER pos_customer_fts_insert AFTER INSERT ON pos_customer BEGIN
+        INSERT INTO pos_customer_fts(rowid, name, tax_id, email)
+        VALUES (new.id, new.name, new.tax_id, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER pos_customer_fts_delete AFTER DELETE ON pos_customer BEGIN
+        INSERT INTO pos_customer_fts(pos_customer_fts, rowid, name, tax_id, email)
+        VALUES ('delete', old.id, old.name, old.tax_id, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER pos_customer_fts_update AFTER UPDATE OF name, tax_id, email ON pos_customer BEGIN
+        INSERT INTO pos_customer_fts(pos_customer_fts, rowid, name, tax_id, email)
+        VALUES ('delete', old.id, old.name, old.tax_id, old.email);
+        INSERT INTO pos_customer_fts(rowid, name, tax_id, email)
+        VALUES (new.id, new.name, new.tax_id, new.email);
+    END
+    """,
+    "INSERT INTO pos_customer_fts(pos_customer_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS pos_customer_fts_insert",
+    "DROP TRIGGER IF EXISTS pos_customer_fts_delete",
+    "DROP TRIGGER IF EXISTS pos_customer_fts_update",
+    "DROP TABLE IF EXISTS pos_customer_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # FTS5 es propio de SQLite; en otros motores la búsqueda usa icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0016_saleitem_unit_cost'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(CREATE_SQL), _run(DROP_SQL)),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:45
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_returned_quantity(apps, schema_editor):
+    """
+    SaleReturnItem no apunta al SaleItem: lo devuelto de cada producto en una
+    venta se reparte entre sus líneas de ese producto, en orden.
+    """
+    SaleItem = apps.get_model('pos', 'SaleItem')
+    SaleReturnItem = apps.get_model('pos', 'SaleReturnItem')
+
+    returned = defaultdict(int)
+    for row in SaleReturnItem.objects.values('return_request__original_sale', 'product').annotate(
+        units=Sum('quantity')
+    ).order_by():
+        returned[(row['return_request__original_sale'], row['product'])] = row['units']
+    if not returned:
+        return
+
+    sale_ids = {sale_id for sale_id, _ in returned}
+    changed = []
+    for item in SaleItem.objects.filter(sale_id__in=sale_ids).order_by('id').iterator():
+        key = (item.sale_id, item.product_id)
+        units = min(returned.get(key, 0), item.quantity)
+        if units:
+            item.returned_quantity = units
+            returned[key] -= units
+            changed.append(item)
+    SaleItem.objects.bulk_update(changed, ['returned_quantity'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0017_customer_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='returned_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Cantidad Devuelta'),
+        ),
+        migrations.RunPython(backfill_returned_quantity, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='saleitem',
+            constraint=models.CheckConstraint(condition=models.Q(('returned_quantity__lte', models.F('quantity'))), name='saleitem_returned_lte_quantity'),
+        ),
+    ]
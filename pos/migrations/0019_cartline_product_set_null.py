@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0018_saleitem_returned_quantity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cartline',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.product', verbose_name='Producto'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0019_cartline_product_set_null'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='pos.product', verbose_name='Producto'),
+        ),
+    ]
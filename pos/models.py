@@ -1,6 +1,9 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 
+from .receipts import encode_receipt_code
+
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Nombre")
 
@@ -13,6 +16,33 @@ class Supplier(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def with_available_stock(self):
+        """
+        Anota `available_stock`: snapshot en Product.stock + movimientos aún no
+        compactados, o la suma de sus StockShard si el producto está repartido.
+        """
+        pending = StockMovement.objects.filter(
+            product=models.OuterRef('pk'),
+            applied=False
+        ).values('product').annotate(total=models.Sum('quantity')).values('total')
+        shards = StockShard.objects.filter(
+            product=models.OuterRef('pk')
+        ).values('product').annotate(total=models.Sum('quantity')).values('total')
+        return self.annotate(
+            available_stock=models.Case(
+                models.When(
+                    sharded_stock=True,
+                    then=Coalesce(models.Subquery(shards, output_field=models.IntegerField()), 0)
+                ),
+                default=models.F('stock') + Coalesce(
+                    models.Subquery(pending, output_field=models.IntegerField()), 0
+                ),
+                output_field=models.IntegerField()
+            )
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nombre")
     sku = models.CharField(max_length=100, unique=True, verbose_name="SKU / Código")
@@ -21,6 +51,10 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0, verbose_name="Cantidad en Stock")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
+    # Productos muy vendidos: el stock se reparte en StockShard para que las cajas no compitan por la fila
+    sharded_stock = models.BooleanField(default=False, editable=False, verbose_name="Stock repartido por caja")
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -43,6 +77,12 @@ class CashDrawerSession(models.Model):
     class Meta:
         verbose_name = "Sesión de Caja"
         verbose_name_plural = "Sesiones de Caja"
+        indexes = [
+            # Búsqueda de la sesión abierta de un cajero
+            models.Index(fields=['user'], condition=models.Q(end_time__isnull=True), name='cashdrawer_open_by_user_idx'),
+            # Historial de sesiones de un cajero (incluidas las cerradas)
+            models.Index(fields=['user', 'end_time'], name='cashdrawer_user_end_time_idx'),
+        ]
 
 
 class Customer(models.Model):
@@ -91,14 +131,59 @@ class Sale(models.Model):
         verbose_name="Cliente"
     )
 
+    # Clave generada por el terminal para no duplicar ventas al reintentar
+    idempotency_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Clave de idempotencia"
+    )
+
+    class Meta:
+        indexes = [
+            # Paginación por keyset (created_at, id) del reporte de ventas
+            models.Index(fields=['created_at', 'id'], name='sale_created_at_id_idx'),
+            # Rangos de fechas por método de pago (dashboards y reportes)
+            models.Index(fields=['created_at', 'payment_method'], name='sale_created_at_payment_idx'),
+        ]
+
+    @property
+    def receipt_code(self):
+        """Código de barras del recibo; la "caja" es la sesión de caja que registró la venta"""
+        return encode_receipt_code(self.id, self.cash_drawer_session_id or 0)
+
     def __str__(self):
         return f"Venta #{self.id} - {self.total_amount}"
+
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     product_name = models.CharField(max_length=200)
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Costo del producto al momento de la venta (Product.cost puede cambiar después)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Unidades ya devueltas en todas las devoluciones de la venta
+    returned_quantity = models.PositiveIntegerField(default=0, verbose_name="Cantidad Devuelta")
+
+    class Meta:
+        indexes = [
+            # Ventas de un producto (historial, devoluciones, borrado protegido)
+            models.Index(fields=['product', 'sale'], name='saleitem_product_sale_idx'),
+        ]
+        constraints = [
+            # Dos devoluciones simultáneas no pueden superar lo vendido
+            models.CheckConstraint(
+                condition=models.Q(returned_quantity__lte=models.F('quantity')),
+                name='saleitem_returned_lte_quantity'
+            ),
+        ]
+
+    @property
+    def returnable_quantity(self):
+        return self.quantity - self.returned_quantity
 
     def __str__(self):
         return f"{self.product_name} x{self.quantity}"
@@ -106,6 +191,28 @@ class SaleItem(models.Model):
 # Create your models here.
 
 
+class CartLine(models.Model):
+    """Línea del carrito en curso de un cajero (una fila por producto)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_lines', verbose_name="Cajero")
+    # SET_NULL: si se borra el producto la línea queda con su nombre para avisar al cajero
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, verbose_name="Producto")
+    name = models.CharField(max_length=200)
+    sku = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Línea de Carrito"
+        verbose_name_plural = "Líneas de Carrito"
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_line_per_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} x{self.quantity}"
+
+
 class SaleReturn(models.Model):
     """Modelo para registrar una devolución completa"""
     original_sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Venta Original")
@@ -138,4 +245,175 @@ class SaleReturnItem(models.Model):
         return f"{self.product.name} x{self.quantity}"
 
     def get_subtotal(self):
-        return self.quantity * self.unit_price
\ No newline at end of file
+        return self.quantity * self.unit_price
+
+class CheckoutQueueEntry(models.Model):
+    """Venta confirmada al terminal y pendiente de registrar (modo POS_CHECKOUT_MODE='queued')"""
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('done', 'Registrada'),
+        ('failed', 'Fallida'),
+    ]
+
+    idempotency_key = models.CharField(max_length=64, unique=True, verbose_name="Clave de idempotencia")
+    user = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name="Cajero")
+    cash_drawer_session = models.ForeignKey(CashDrawerSession, on_delete=models.PROTECT, verbose_name="Sesión de Caja")
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Cliente")
+    payment_method = models.CharField(max_length=10, choices=Sale.PAYMENT_METHOD_CHOICES, default='cash')
+    cart = models.JSONField(verbose_name="Carrito")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    error = models.TextField(blank=True)
+    sale = models.OneToOneField(Sale, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Venta")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Venta en Cola"
+        verbose_name_plural = "Ventas en Cola"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Cola #{self.id} - {self.get_status_display()}"
+
+
+class StockMovement(models.Model):
+    """
+    Libro de movimientos de stock (solo inserciones).
+
+    Product.stock es el snapshot compactado; el stock disponible es el
+    snapshot más los movimientos con applied=False (ver compact_stock_movements).
+    """
+    KIND_CHOICES = [
+        ('sale', 'Venta'),
+        ('return', 'Devolución'),
+        ('adjustment', 'Ajuste'),
+    ]
+
+    # CASCADE: un producto sin ventas (solo ajustes) se puede borrar junto con su libro
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements', verbose_name="Producto")
+    quantity = models.IntegerField(verbose_name="Cantidad")  # negativa en ventas
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Tipo")
+    sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Venta")
+    sale_return = models.ForeignKey(SaleReturn, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Devolución")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Registrado por")
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied = models.BooleanField(default=False, verbose_name="Compactado")
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['product'], condition=models.Q(applied=False), name='stockmovement_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.product_id}: {self.quantity:+d}"
+
+
+class StockShard(models.Model):
+    """Sub-contador de stock de un producto repartido; cada caja descuenta del suyo"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards', verbose_name="Producto")
+    shard = models.PositiveSmallIntegerField(verbose_name="Sub-contador")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="Cantidad")
+
+    class Meta:
+        verbose_name = "Sub-contador de Stock"
+        verbose_name_plural = "Sub-contadores de Stock"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}[{self.shard}]: {self.quantity}"
+
+
+class DailySalesSummary(models.Model):
+    """Totales diarios por método de pago y cajero, mantenidos en checkout y devoluciones"""
+    date = models.DateField(verbose_name="Fecha")
+    payment_method = models.CharField(max_length=10, choices=Sale.PAYMENT_METHOD_CHOICES, verbose_name="Método de Pago")
+    cashier = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Cajero")
+    sale_count = models.PositiveIntegerField(default=0, verbose_name="Ventas")
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Vendido")
+    refund_count = models.PositiveIntegerField(default=0, verbose_name="Devoluciones")
+    refund_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Reembolsado")
+
+    class Meta:
+        verbose_name = "Resumen Diario de Ventas"
+        verbose_name_plural = "Resúmenes Diarios de Ventas"
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'payment_method', 'cashier'],
+                name='unique_daily_sales_summary'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.payment_method}: {self.total_amount}"
+
+
+class ProductDailySales(models.Model):
+    """Unidades e ingresos por producto y día, mantenidos en checkout y devoluciones"""
+    date = models.DateField(verbose_name="Fecha")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales', verbose_name="Producto")
+    units = models.IntegerField(default=0, verbose_name="Unidades")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Ingresos")
+
+    class Meta:
+        verbose_name = "Venta Diaria por Producto"
+        verbose_name_plural = "Ventas Diarias por Producto"
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_product_daily_sales'),
+        ]
+        indexes = [
+            # Índice cubriente: el top por rango de fechas no lee la tabla
+            models.Index(fields=['date', 'product', 'units', 'revenue'], name='productdailysales_top_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product}: {self.units}"
+
+
+class ReportJob(models.Model):
+    """
+    Exportación de reporte generada fuera de la petición (ver pos/reports.py).
+    El archivo se reutiliza mientras no cambien las ventas del rango (watermark).
+    """
+    KIND_CHOICES = [
+        ('excel', 'Excel'),
+        ('pdf', 'PDF'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'Generando'),
+        ('done', 'Listo'),
+        ('failed', 'Fallido'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Formato")
+    start_date = models.DateField(verbose_name="Fecha Inicial")
+    end_date = models.DateField(verbose_name="Fecha Final")
+    watermark = models.CharField(max_length=64, verbose_name="Marca de datos")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    file_path = models.CharField(max_length=255, blank=True, verbose_name="Archivo")
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Solicitado por")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Reporte en Segundo Plano"
+        verbose_name_plural = "Reportes en Segundo Plano"
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'start_date', 'end_date', 'watermark'],
+                name='unique_report_artifact'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.start_date} a {self.end_date} - {self.get_status_display()}"
@@ -0,0 +1,24 @@
+# pos/receipts.py
+# Código del recibo: 13 dígitos (como EAN-13) = caja (3) + venta (9) + dígito verificador.
+# Se deriva del id de la venta, así que no se guarda: buscarlo es leer Sale por clave primaria.
+
+RECEIPT_CODE_LENGTH = 13
+
+
+def check_digit(digits):
+    """Dígito verificador EAN-13 de 12 dígitos (pesos 1 y 3 alternados)"""
+    total = sum(int(digit) * (3 if position % 2 else 1) for position, digit in enumerate(digits))
+    return str(-total % 10)
+
+
+def encode_receipt_code(sale_id, terminal):
+    digits = f"{terminal % 1000:03d}{sale_id:09d}"
+    return digits + check_digit(digits)
+
+
+def decode_receipt_code(code):
+    """(caja, id de venta) del código escaneado, o None si no es un código válido"""
+    code = code.strip()
+    if len(code) != RECEIPT_CODE_LENGTH or not code.isdigit() or check_digit(code[:-1]) != code[-1]:
+        return None
+    return int(code[:3]), int(code[3:12])
@@ -0,0 +1,493 @@
+# pos/reports.py
+import hashlib
+import os
+import tempfile
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Avg, Count, F, Max, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.http import FileResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+from .dates import date_range_q
+from .models import ReportJob, Sale
+
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_CHUNK_SIZE = 2000
+
+REPORT_FORMATS = {
+    # kind: (extensión, content type)
+    'excel': ('xlsx', EXCEL_CONTENT_TYPE),
+    'pdf': ('pdf', 'application/pdf'),
+}
+
+PAYMENT_LABELS = {'cash': 'Efectivo', 'card': 'Tarjeta'}
+
+
+def sales_rows(sales):
+    """Filas (id, fecha, vendedor, método, total) leídas por bloques, sin instanciar Sale"""
+    return sales.values_list(
+        'id', 'created_at', 'cash_drawer_session__user__username', 'payment_method', 'total_amount'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def sales_breakdowns(sales):
+    """
+    Desgloses del periodo por día, hora del día, cajero y método de pago.
+    Cada uno es un GROUP BY en la BD: se leen unas pocas filas agregadas en
+    lugar de todas las ventas. Devuelve [(título, columna, filas)], con filas
+    {'label', 'count', 'total', 'average'}.
+    """
+    tz = timezone.get_current_timezone()
+    sales = sales.order_by()
+    metrics = {'count': Count('id'), 'total': Sum('total_amount')}
+
+    groups = [
+        ('Por día', 'Día',
+         sales.values(key=TruncDate('created_at', tzinfo=tz)).annotate(**metrics).order_by('key'),
+         lambda day: day.strftime('%d/%m/%Y')),
+        ('Por hora', 'Hora',
+         sales.values(key=ExtractHour('created_at', tzinfo=tz)).annotate(**metrics).order_by('key'),
+         lambda hour: f"{hour:02d}:00"),
+        ('Por cajero', 'Cajero',
+         sales.values(key=F('cash_drawer_session__user__username')).annotate(**metrics).order_by('-total'),
+         lambda username: username or "N/A"),
+        ('Por método de pago', 'Método de pago',
+         sales.values(key=F('payment_method')).annotate(**metrics).order_by('-total'),
+         lambda method: PAYMENT_LABELS.get(method, method)),
+    ]
+    return [
+        (title, column, [
+            {
+                'label': label(row['key']),
+                'count': row['count'],
+                'total': row['total'] or 0,
+                'average': (row['total'] or 0) / row['count'],
+            }
+            for row in rows
+        ])
+        for title, column, rows, label in groups
+    ]
+
+
+def write_sales_excel(sales, start_date, end_date, fileobj):
+    """
+    Escribe el reporte de ventas en `fileobj` con openpyxl en modo write-only:
+    las filas pasan a un archivo temporal a medida que se leen, así que la
+    memoria no depende de la cantidad de ventas.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=f"Ventas {start_date} a {end_date}")  # Excel admite 31 caracteres
+
+    # Los anchos deben definirse antes de escribir filas
+    for letter, width in zip('ABCDE', [12, 20, 20, 15, 12]):
+        ws.column_dimensions[letter].width = width
+
+    def cell(value, **style):
+        cell = WriteOnlyCell(ws, value=value)
+        for attribute, style_value in style.items():
+            setattr(cell, attribute, style_value)
+        return cell
+
+    bold = Font(bold=True)
+    header_fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+
+    # Título y encabezados
+    ws.append([cell(f"Reporte de Ventas - {start_date} a {end_date}", font=Font(size=14, bold=True))])
+    ws.append([])
+    ws.append([
+        cell(header, font=bold, fill=header_fill)
+        for header in ['ID Venta', 'Fecha', 'Vendedor', 'Método Pago', 'Total']
+    ])
+
+    # Datos
+    last_row = 3
+    for sale_id, created_at, username, payment_method, total_amount in sales_rows(sales):
+        ws.append([
+            sale_id,
+            created_at.strftime('%d/%m/%Y %H:%M'),
+            username or "N/A",
+            PAYMENT_LABELS.get(payment_method, payment_method),
+            float(total_amount),
+        ])
+        last_row += 1
+
+    # Totales
+    ws.append([])
+    ws.append([None, None, None, cell("TOTAL:", font=bold), cell(f"=SUM(E4:E{last_row})", font=bold)])
+
+    # Una hoja por desglose
+    for title, column, rows in sales_breakdowns(sales):
+        ws = wb.create_sheet(title=title)
+        for letter, width in zip('ABCD', [18, 15, 15, 15]):
+            ws.column_dimensions[letter].width = width
+        ws.append([
+            cell(header, font=bold, fill=header_fill)
+            for header in [column, 'Transacciones', 'Total', 'Ticket Promedio']
+        ])
+        for row in rows:
+            ws.append([row['label'], row['count'], float(row['total']), round(float(row['average']), 2)])
+
+    wb.save(fileobj)
+
+
+def excel_report_response(sales, start_date, end_date):
+    """Genera el Excel en un archivo temporal y lo envía por partes (FileResponse)"""
+    fileobj = tempfile.TemporaryFile()
+    write_sales_excel(sales, start_date, end_date, fileobj)
+    fileobj.seek(0)
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=f"reporte_ventas_{start_date}_a_{end_date}.xlsx",
+        content_type=EXCEL_CONTENT_TYPE
+    )
+
+
+PDF_FOOTER_MARGIN = 40  # las tablas terminan por encima del pie "Página N" (y=20)
+PDF_SALES_HEADER = ['ID', 'Fecha', 'Vendedor', 'Método', 'Total']
+PDF_COLUMN_WIDTHS = [50, 80, 80, 60, 60]
+
+PDF_SUMMARY_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5C5CBD')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#e9ecef')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+PDF_SALES_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5C5CBD')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+]
+
+PDF_TOTAL_ROW_STYLE = [
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e9ecef')),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+]
+
+
+def _pdf_row_heights(pdf):
+    """(alto del encabezado, alto de una fila) de la tabla de ventas, medidos con wrapOn"""
+    sample = ['0', '01/01/2000 00:00', 'usuario', 'Efectivo', '$0.00']
+
+    def measure(rows):
+        table = Table([PDF_SALES_HEADER] + rows, colWidths=PDF_COLUMN_WIDTHS)
+        table.setStyle(TableStyle(PDF_SALES_STYLE))
+        return table.wrapOn(pdf, sum(PDF_COLUMN_WIDTHS), 10000)[1]
+
+    header = measure([])
+    return header, measure([sample]) - header
+
+
+def _pdf_pages(rows, first_capacity, capacity):
+    """
+    Agrupa las filas por página (`first_capacity` en la primera, que lleva
+    título y resumen, y `capacity` en las demás) y avisa cuál es la última.
+    La última siempre deja lugar para la fila de total.
+    """
+    page = list(islice(rows, first_capacity))
+    if not page:
+        return
+    page_capacity = first_capacity
+    while True:
+        next_page = list(islice(rows, capacity))
+        if not next_page:
+            break
+        yield page, False
+        page, page_capacity = next_page, capacity
+    if len(page) >= page_capacity:
+        # Página llena: la última fila pasa a otra página junto al total
+        yield page[:-1], False
+        page = page[-1:]
+    yield page, True
+
+
+def write_sales_pdf(sales, start_date, end_date, fileobj):
+    """
+    Escribe el reporte de ventas en PDF en `fileobj`. Las filas se leen por
+    bloques y se dibuja una tabla por página en el canvas, así que en memoria
+    solo vive la página actual (más las páginas ya comprimidas). Los totales
+    salen de un aggregate en la BD.
+    """
+    totals = sales.order_by().aggregate(total=Sum('total_amount'), count=Count('id'))
+    total_sales = totals['total'] or 0
+
+    styles = getSampleStyleSheet()
+    width, height = A4
+    top = height - 30
+    pdf = canvas.Canvas(fileobj, pagesize=A4, pageCompression=1)
+
+    def draw(flowable, y):
+        """Dibuja centrado horizontalmente con el borde superior en `y`; devuelve el nuevo `y`"""
+        flowable_width, flowable_height = flowable.wrapOn(pdf, width - 144, y)
+        flowable.drawOn(pdf, (width - flowable_width) / 2, y - flowable_height)
+        return y - flowable_height
+
+    def footer(page_number):
+        pdf.setFont('Helvetica', 8)
+        pdf.drawCentredString(width / 2, 20, f"Página {page_number}")
+
+    # Título y resumen
+    y = draw(Paragraph(f"<b>Reporte de Ventas</b><br/>Período: {start_date} a {end_date}", styles['Heading2']), top)
+    summary_table = Table([
+        ["Total de Ventas:", f"${total_sales:.2f}"],
+        ["Total de Transacciones:", str(totals['count'])],
+        ["Período:", f"{start_date} a {end_date}"]
+    ], colWidths=[150, 100])
+    summary_table.setStyle(PDF_SUMMARY_STYLE)
+    y = draw(summary_table, y - 20) - 30
+
+    # Tabla de ventas detalladas, una por página, tantas filas como quepan sobre el pie
+    header_height, row_height = _pdf_row_heights(pdf)
+    first_capacity = max(1, int((y - PDF_FOOTER_MARGIN - header_height) // row_height))
+    capacity = max(1, int((top - PDF_FOOTER_MARGIN - header_height) // row_height))
+
+    page_number = 1
+    footer(page_number)
+    for page, is_last in _pdf_pages(sales_rows(sales), first_capacity, capacity):
+        data = [list(PDF_SALES_HEADER)]
+        data.extend(
+            [
+                str(sale_id),
+                created_at.strftime('%d/%m/%Y %H:%M'),
+                username or "N/A",
+                PAYMENT_LABELS.get(payment_method, payment_method),
+                f"${total_amount:.2f}"
+            ]
+            for sale_id, created_at, username, payment_method, total_amount in page
+        )
+        style = list(PDF_SALES_STYLE)
+        if is_last:
+            data.append(['', '', '', 'TOTAL:', f"${total_sales:.2f}"])
+            style += PDF_TOTAL_ROW_STYLE
+
+        table = Table(data, colWidths=PDF_COLUMN_WIDTHS)
+        table.setStyle(TableStyle(style))
+        draw(table, y)
+
+        if not is_last:
+            pdf.showPage()
+            page_number += 1
+            footer(page_number)
+            y = top
+
+    pdf.save()
+
+
+# =============================================================================
+# REPORTES EN SEGUNDO PLANO
+# =============================================================================
+
+WRITERS = {
+    'excel': write_sales_excel,
+    'pdf': write_sales_pdf,
+}
+
+
+def sales_in_range(start_date, end_date):
+    return Sale.objects.filter(
+        date_range_q('created_at', start_date, end_date)
+    ).select_related(
+        'cash_drawer_session',
+        'cash_drawer_session__user'
+    ).order_by('-created_at')
+
+
+REPORT_PAGE_SIZE = 50
+
+
+def sales_totals(sales):
+    """Total, cantidad y ticket promedio en un solo aggregate"""
+    totals = sales.order_by().aggregate(
+        total_sales=Sum('total_amount'),
+        total_transactions=Count('id'),
+        average_ticket=Avg('total_amount')
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def encode_cursor(sale):
+    return f"{sale.created_at.isoformat()}_{sale.id}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) del cursor, o None si no es válido"""
+    created_at, _, sale_id = (cursor or '').rpartition('_')
+    try:
+        created_at = parse_datetime(created_at)
+        sale_id = int(sale_id)
+    except ValueError:
+        return None
+    return (created_at, sale_id) if created_at else None
+
+
+def sales_page(sales, cursor=None, size=REPORT_PAGE_SIZE):
+    """
+    Página de ventas de la más reciente a la más antigua con paginación por
+    keyset sobre (created_at, id): el costo no depende de cuántas páginas se
+    hayan cargado antes. Devuelve (ventas, cursor de la siguiente página o None).
+    """
+    sales = sales.order_by('-created_at', '-id')
+    position = decode_cursor(cursor)
+    if position:
+        created_at, sale_id = position
+        sales = sales.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=sale_id))
+
+    page = list(sales[:size + 1])
+    next_cursor = encode_cursor(page[size - 1]) if len(page) > size else None
+    return page[:size], next_cursor
+
+
+# Subir al cambiar el contenido de los archivos: los generados antes dejan de reutilizarse
+REPORT_LAYOUT_VERSION = 2
+
+
+def data_watermark(start_date, end_date):
+    """
+    Cambia cuando se agrega, elimina o edita una venta del rango: además del
+    número de ventas y el último id, resume en un hash el total y la cantidad
+    de ventas por (método de pago, sesión de caja), los campos que el admin
+    deja editar y que salen en los archivos.
+    """
+    groups = Sale.objects.filter(date_range_q('created_at', start_date, end_date)).values(
+        'payment_method', 'cash_drawer_session'
+    ).annotate(count=Count('id'), last=Max('id'), total=Sum('total_amount')).order_by(
+        'payment_method', 'cash_drawer_session'
+    )
+    count, last = 0, 0
+    digest = hashlib.sha1()
+    for group in groups:
+        count += group['count']
+        last = max(last, group['last'])
+        digest.update(
+            f"{group['payment_method']}|{group['cash_drawer_session']}|{group['count']}|{group['total']};".encode()
+        )
+    return f"v{REPORT_LAYOUT_VERSION}-{count}-{last}-{digest.hexdigest()[:16]}"
+
+
+def reports_dir():
+    path = Path(getattr(settings, 'POS_REPORTS_DIR', Path(settings.BASE_DIR) / 'report_files'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def requeue_stale_report_jobs():
+    """
+    Devuelve a 'pending' los trabajos 'running' que empezaron hace más de
+    POS_REPORT_JOB_TIMEOUT segundos (el worker murió o se colgó); sin esto
+    la fila única del reporte quedaría 'Generando' para siempre.
+    """
+    limit = timezone.now() - timezone.timedelta(seconds=getattr(settings, 'POS_REPORT_JOB_TIMEOUT', 600))
+    return ReportJob.objects.filter(status='running').filter(
+        # Los que se tomaron antes de existir started_at se miden por created_at
+        Q(started_at__lt=limit) | Q(started_at__isnull=True, created_at__lt=limit)
+    ).update(status='pending')
+
+
+def request_report(kind, start_date, end_date, user=None):
+    """
+    Devuelve el trabajo del reporte para los datos actuales del rango: uno ya
+    generado si el archivo sigue en disco, o uno pendiente para el worker.
+    """
+    key = dict(kind=kind, start_date=start_date, end_date=end_date, watermark=data_watermark(start_date, end_date))
+    try:
+        with transaction.atomic():
+            job, created = ReportJob.objects.get_or_create(**key, defaults={'requested_by': user})
+    except IntegrityError:
+        job, created = ReportJob.objects.get(**key), False
+
+    if job.status == 'running' and requeue_stale_report_jobs():
+        job.refresh_from_db()
+
+    stale = job.status == 'failed' or (job.status == 'done' and not os.path.exists(job.file_path))
+    if not created and stale:
+        ReportJob.objects.filter(pk=job.pk, status=job.status).update(status='pending', error='', file_path='')
+        job.refresh_from_db()
+    return job
+
+
+def run_report_job(job_id):
+    """Genera el archivo de un trabajo pendiente; devuelve False si otro worker ya lo tomó"""
+    if not ReportJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=timezone.now()):
+        return False
+
+    job = ReportJob.objects.get(pk=job_id)
+    extension = REPORT_FORMATS[job.kind][0]
+    path = reports_dir() / f"ventas_{job.start_date}_{job.end_date}_{job.watermark}.{extension}"
+    # Se escribe en un temporal y se renombra: nunca se sirve un archivo a medias
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            WRITERS[job.kind](sales_in_range(job.start_date, job.end_date), job.start_date, job.end_date, fileobj)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        ReportJob.objects.filter(pk=job_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        return True
+
+    ReportJob.objects.filter(pk=job_id).update(status='done', file_path=str(path), finished_at=timezone.now())
+
+    # Los archivos de versiones anteriores del mismo reporte ya no se van a servir
+    superseded = ReportJob.objects.filter(
+        kind=job.kind, start_date=job.start_date, end_date=job.end_date, status='done'
+    ).exclude(pk=job_id)
+    for old_path in superseded.values_list('file_path', flat=True):
+        if old_path and os.path.exists(old_path):
+            os.remove(old_path)
+    superseded.delete()
+    return True
+
+
+def _init_worker():
+    # Con 'spawn' el proceso hijo arranca sin Django configurado
+    django.setup()
+
+
+def run_pending_report_jobs(limit=10, workers=2):
+    """Genera los reportes pendientes en un pool de procesos; devuelve cuántos procesó"""
+    requeue_stale_report_jobs()
+    job_ids = list(ReportJob.objects.filter(status='pending').order_by('id').values_list('id', flat=True)[:limit])
+    if not job_ids:
+        return 0
+    if workers <= 1:
+        return sum(run_report_job(job_id) for job_id in job_ids)
+
+    # Los procesos hijos no deben heredar las conexiones abiertas del padre
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return sum(pool.map(run_report_job, job_ids))
+
+
+def report_file_response(job):
+    extension, content_type = REPORT_FORMATS[job.kind]
+    return FileResponse(
+        open(job.file_path, 'rb'),
+        as_attachment=True,
+        filename=f"reporte_ventas_{job.start_date}_a_{job.end_date}.{extension}",
+        content_type=content_type
+    )
@@ -0,0 +1,158 @@
+# pos/returns.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, When
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Sale, SaleItem, SaleReturn, SaleReturnItem
+from .receipts import decode_receipt_code
+from .stock import restock, shard_for
+from .summary import record_refund
+
+
+RETURN_FRAGMENT_KEY = 'pos:return_fragment:{sale_id}'
+# El token CSRF es propio de cada navegador: el fragmento se guarda con este
+# hueco y la vista lo completa en cada respuesta
+CSRF_SLOT = '<!-- csrf -->'
+
+
+class ReturnError(Exception):
+    """Error de negocio al procesar una devolución"""
+
+
+def parse_sale_lookup(text):
+    """
+    (id de venta, caja o None) a partir de un código de recibo escaneado o de
+    un id tecleado; lanza ValueError si no es ninguno de los dos.
+    """
+    decoded = decode_receipt_code(text)
+    if decoded:
+        terminal, sale_id = decoded
+        return sale_id, terminal
+    return int(text), None
+
+
+def return_details_html(sale_id, terminal=None):
+    """
+    Fragmento con la venta y sus líneas (incluido lo ya devuelto) para el
+    formulario de devolución, o None si no existe o la caja del código no
+    coincide. Se guarda en la caché POS_RETURN_FRAGMENT_TTL segundos: mientras
+    el cajero trabaja la devolución, volver a escanear no consulta la BD.
+    process_return lo borra.
+    """
+    key = RETURN_FRAGMENT_KEY.format(sale_id=sale_id)
+    cached = cache.get(key)
+    if cached is None:
+        sale = Sale.objects.select_related(
+            'customer',
+            'cash_drawer_session',
+            'cash_drawer_session__user'
+        ).prefetch_related('items').filter(pk=sale_id).first()
+        if sale is None:
+            return None
+        html = render_to_string('pos/partials/sale_return_details.html', {
+            'sale': sale,
+            'csrf_input': mark_safe(CSRF_SLOT),
+        })
+        # La caja va junto al HTML para validar los códigos escaneados sin leer la venta
+        cached = ((sale.cash_drawer_session_id or 0) % 1000, html)
+        cache.set(key, cached, getattr(settings, 'POS_RETURN_FRAGMENT_TTL', 120))
+
+    sale_terminal, html = cached
+    if terminal is not None and terminal != sale_terminal:
+        return None
+    return html
+
+
+def invalidate_return_fragment(sale_id):
+    cache.delete(RETURN_FRAGMENT_KEY.format(sale_id=sale_id))
+
+
+def parse_return_quantities(data):
+    """{sale_item_id: unidades} a partir de los campos return_qty_<id> del formulario"""
+    quantities = {}
+    for key, value in data.items():
+        if not key.startswith('return_qty_'):
+            continue
+        try:
+            item_id, quantity = int(key[len('return_qty_'):]), int(value or 0)
+        except ValueError:
+            raise ReturnError("Cantidad a devolver inválida")
+        if quantity < 0:
+            raise ReturnError("Cantidad a devolver inválida")
+        if quantity:
+            quantities[item_id] = quantity
+    return quantities
+
+
+def process_return(sale, quantities, user, reason=''):
+    """
+    Registra la devolución de `quantities` ({sale_item_id: unidades}) con un
+    número fijo de consultas: un SELECT de las líneas, el INSERT de la
+    devolución, un bulk_create de sus items, un UPDATE con CASE del
+    acumulado devuelto y los movimientos de stock.
+
+    SaleItem.returned_quantity acumula lo devuelto en todas las devoluciones;
+    la restricción de la BD impide superar lo vendido aunque dos devoluciones
+    de la misma venta lleguen a la vez.
+    """
+    if not quantities:
+        raise ReturnError("No se seleccionaron productos para devolver")
+
+    with transaction.atomic():
+        items = SaleItem.objects.select_for_update().filter(sale=sale).in_bulk(list(quantities))
+        if len(items) != len(quantities):
+            raise ReturnError("Item de venta no encontrado")
+
+        for item_id, quantity in quantities.items():
+            item = items[item_id]
+            if quantity > item.returnable_quantity:
+                raise ReturnError(
+                    f"No se puede devolver más de {item.returnable_quantity} unidades de {item.product_name}"
+                )
+
+        restocked = {}
+        refunded = {}
+        for item_id, quantity in quantities.items():
+            item = items[item_id]
+            amount = quantity * item.unit_price
+            restocked[item.product_id] = restocked.get(item.product_id, 0) + quantity
+            units, total = refunded.get(item.product_id, (0, Decimal('0')))
+            refunded[item.product_id] = (units + quantity, total + amount)
+
+        sale_return = SaleReturn.objects.create(
+            original_sale=sale,
+            reason=reason,
+            processed_by=user,
+            total_refund=sum(amount for _, amount in refunded.values())
+        )
+        SaleReturnItem.objects.bulk_create([
+            SaleReturnItem(
+                return_request=sale_return,
+                product_id=items[item_id].product_id,
+                quantity=quantity,
+                unit_price=items[item_id].unit_price
+            )
+            for item_id, quantity in quantities.items()
+        ])
+
+        try:
+            with transaction.atomic():
+                SaleItem.objects.filter(pk__in=list(quantities)).update(returned_quantity=Case(
+                    *[When(pk=item_id, then=F('returned_quantity') + quantity)
+                      for item_id, quantity in quantities.items()],
+                    default=F('returned_quantity'),
+                    output_field=IntegerField()
+                ))
+        except IntegrityError:
+            # Otra devolución de la misma venta se confirmó entre la lectura y el UPDATE
+            raise ReturnError("Las unidades ya fueron devueltas en otra devolución, vuelve a buscar la venta")
+
+        restock(restocked, 'return', shard=shard_for(user.id), sale_return=sale_return, user=user)
+        record_refund(sale_return, sale.payment_method, refunded)
+        transaction.on_commit(lambda: invalidate_return_fragment(sale.id))
+    return sale_return
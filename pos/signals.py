@@ -0,0 +1,23 @@
+# pos/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import product_index, sku_cache
+from .models import Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_sku_cache(sender, instance, **kwargs):
+    """Cualquier edición de producto (admin, list_editable, shell) invalida su SKU"""
+    sku_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def update_product_index(sender, instance, **kwargs):
+    product_index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_product_index(sender, instance, **kwargs):
+    product_index.remove(instance.pk)
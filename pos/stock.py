@@ -0,0 +1,201 @@
+# pos/stock.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+
+from .models import Product, StockMovement, StockShard
+
+
+def record_movements(deltas, kind, sale=None, sale_return=None, user=None, applied_ids=()):
+    """
+    Inserta un movimiento por producto ({product_id: delta}) en un solo bulk_create.
+    Los productos en `applied_ids` (repartidos) ya reflejan el cambio en sus
+    sub-contadores, así que su movimiento queda solo como historial.
+    """
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=product_id,
+            quantity=delta,
+            kind=kind,
+            sale=sale,
+            sale_return=sale_return,
+            created_by=user,
+            applied=product_id in applied_ids
+        )
+        for product_id, delta in deltas.items()
+        if delta
+    ])
+
+
+def get_available_stock(product_ids):
+    """{product_id: stock disponible} con una sola consulta"""
+    return dict(
+        Product.objects.with_available_stock()
+        .filter(pk__in=product_ids)
+        .values_list('pk', 'available_stock')
+    )
+
+
+def restock(deltas, kind, shard=0, sale_return=None, user=None):
+    """Devuelve unidades al stock (devoluciones); en productos repartidos van al sub-contador de la caja"""
+    sharded = set(
+        Product.objects.filter(pk__in=list(deltas), sharded_stock=True).values_list('pk', flat=True)
+    )
+    for product_id in sharded:
+        updated = StockShard.objects.filter(product_id=product_id, shard=shard).update(
+            quantity=F('quantity') + deltas[product_id]
+        )
+        if not updated:
+            # La caja no tiene sub-contador (cambió POS_STOCK_SHARDS): se reparte entre todos
+            _redistribute(product_id, delta=deltas[product_id])
+    record_movements(deltas, kind, sale_return=sale_return, user=user, applied_ids=sharded)
+
+
+def set_stock_level(product, counted, user=None):
+    """Ajusta el stock disponible al valor contado registrando la diferencia en el libro"""
+    if product.sharded_stock:
+        with transaction.atomic():
+            total = _redistribute(product.pk, counted)
+            record_movements({product.pk: counted - total}, 'adjustment', user=user, applied_ids={product.pk})
+        return
+
+    available = get_available_stock([product.pk]).get(product.pk, 0)
+    record_movements({product.pk: counted - available}, 'adjustment', user=user)
+
+
+def compact_stock_movements():
+    """
+    Suma los movimientos pendientes en Product.stock y los marca como aplicados.
+    Se bloquean y leen primero los ids pendientes: solo esas filas se suman y
+    se marcan, así un movimiento que se confirme a mitad no se pierde.
+    Devuelve cuántos productos se actualizaron.
+    """
+    with transaction.atomic():
+        pending = list(
+            StockMovement.objects.select_for_update().filter(applied=False)
+            .values_list('id', 'product', 'quantity')
+        )
+        if not pending:
+            return 0
+
+        deltas = {}
+        for _, product_id, quantity in pending:
+            deltas[product_id] = deltas.get(product_id, 0) + quantity
+        deltas = {product_id: total for product_id, total in deltas.items() if total}
+
+        if deltas:
+            Product.objects.filter(pk__in=list(deltas)).update(stock=Case(
+                *[When(pk=product_id, then=F('stock') + total) for product_id, total in deltas.items()],
+                default=F('stock'),
+                output_field=IntegerField()
+            ))
+        ids = [movement_id for movement_id, _, _ in pending]
+        # En tandas para no superar el límite de parámetros de la BD
+        for index in range(0, len(ids), 500):
+            StockMovement.objects.filter(id__in=ids[index:index + 500]).update(applied=True)
+
+    return len(deltas)
+
+
+COMPACTION_LOCK_KEY = 'pos:stock_compaction'
+
+
+def maybe_compact_stock():
+    """
+    Compacta el libro como mucho una vez cada POS_STOCK_COMPACTION_INTERVAL
+    segundos entre todos los workers (cache.add solo lo consigue uno). Se
+    llama al confirmar cada venta, así los pendientes que suma cada lectura
+    de stock no crecen sin límite aunque no corra `compact_stock --loop`.
+    """
+    interval = getattr(settings, 'POS_STOCK_COMPACTION_INTERVAL', 60)
+    if interval and cache.add(COMPACTION_LOCK_KEY, True, interval):
+        try:
+            compact_stock_movements()
+        except DatabaseError:
+            # La venta ya está confirmada: se reintenta con la próxima
+            cache.delete(COMPACTION_LOCK_KEY)
+
+
+# =============================================================================
+# SUB-CONTADORES PARA PRODUCTOS MUY VENDIDOS
+# =============================================================================
+
+def shard_count():
+    return getattr(settings, 'POS_STOCK_SHARDS', 8)
+
+
+def shard_for(user_id):
+    """Sub-contador fijo de cada caja (cajero)"""
+    return user_id % shard_count()
+
+
+def _split(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (1 if index < extra else 0) for index in range(parts)]
+
+
+def _redistribute(product_id, total=None, delta=0):
+    """
+    Bloquea los sub-contadores del producto y reparte en partes iguales
+    `total` (por defecto su suma actual) más `delta`. Devuelve la suma
+    anterior, o None sin tocar nada si el resultado fuera negativo.
+    """
+    shards = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('shard'))
+    current = sum(shard.quantity for shard in shards)
+    target = (current if total is None else total) + delta
+    if target < 0 or not shards:
+        return None if target < 0 else current
+
+    for shard, quantity in zip(shards, _split(target, len(shards))):
+        shard.quantity = quantity
+    StockShard.objects.bulk_update(shards, ['quantity'])
+    return current
+
+
+def enable_sharding(product):
+    """Pasa el stock disponible del producto a `POS_STOCK_SHARDS` sub-contadores"""
+    with transaction.atomic():
+        if Product.objects.select_for_update().get(pk=product.pk).sharded_stock:
+            return
+        available = get_available_stock([product.pk]).get(product.pk, 0)
+        StockMovement.objects.filter(product_id=product.pk, applied=False).update(applied=True)
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product.pk, shard=index, quantity=quantity)
+            for index, quantity in enumerate(_split(available, shard_count()))
+        ])
+        Product.objects.filter(pk=product.pk).update(stock=available, sharded_stock=True)
+
+
+def disable_sharding(product):
+    """Vuelve a un único contador: Product.stock = suma de los sub-contadores"""
+    with transaction.atomic():
+        if not Product.objects.select_for_update().get(pk=product.pk).sharded_stock:
+            return
+        shards = StockShard.objects.select_for_update().filter(product_id=product.pk)
+        total = shards.aggregate(total=Sum('quantity'))['total'] or 0
+        shards.delete()
+        Product.objects.filter(pk=product.pk).update(stock=total, sharded_stock=False)
+
+
+def take_from_shards(product_id, quantity, shard):
+    """
+    Descuenta `quantity` del sub-contador de la caja con un UPDATE condicional.
+    Si no alcanza, rebalancea los sub-contadores del producto descontando la
+    venta; devuelve False si el total no alcanza.
+    """
+    own = StockShard.objects.filter(product_id=product_id, shard=shard, quantity__gte=quantity)
+    if own.update(quantity=F('quantity') - quantity):
+        return True
+
+    # Camino lento: bloquea todos los sub-contadores del producto
+    return _redistribute(product_id, delta=-quantity) is not None
+
+
+def rebalance_stock_shards():
+    """Reparte en partes iguales los sub-contadores de todos los productos repartidos"""
+    product_ids = list(Product.objects.filter(sharded_stock=True).values_list('pk', flat=True))
+    for product_id in product_ids:
+        with transaction.atomic():
+            _redistribute(product_id)
+    return len(product_ids)
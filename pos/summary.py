@@ -0,0 +1,198 @@
+# pos/summary.py
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .dates import date_range_q
+from .models import DailySalesSummary, Product, ProductDailySales, Sale, SaleItem, SaleReturn, SaleReturnItem
+
+
+def _add_to_summary(date, payment_method, cashier_id, **increments):
+    """Suma los incrementos a la fila (fecha, método, cajero), creándola si no existe"""
+    rows = DailySalesSummary.objects.filter(date=date, payment_method=payment_method, cashier_id=cashier_id)
+    changes = {field: F(field) + value for field, value in increments.items()}
+    if rows.update(**changes):
+        return
+
+    try:
+        with transaction.atomic():
+            DailySalesSummary.objects.create(
+                date=date, payment_method=payment_method, cashier_id=cashier_id, **increments
+            )
+    except IntegrityError:
+        # Otra caja creó la fila al mismo tiempo
+        rows.update(**changes)
+
+
+def _add_to_product_sales(date, product_sales):
+    """
+    Suma {product_id: (unidades, ingresos)} a los contadores del día con dos
+    consultas fijas: INSERT de las filas que falten (ignorando las que ya
+    existen) y un UPDATE con CASE para todas.
+    """
+    if not product_sales:
+        return
+
+    ProductDailySales.objects.bulk_create(
+        [ProductDailySales(date=date, product_id=product_id) for product_id in product_sales],
+        ignore_conflicts=True
+    )
+    ProductDailySales.objects.filter(date=date, product_id__in=list(product_sales)).update(
+        units=Case(
+            *[When(product_id=product_id, then=F('units') + units)
+              for product_id, (units, _) in product_sales.items()],
+            default=F('units'),
+            output_field=IntegerField()
+        ),
+        revenue=Case(
+            *[When(product_id=product_id, then=F('revenue') + revenue)
+              for product_id, (_, revenue) in product_sales.items()],
+            default=F('revenue'),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    )
+
+
+def record_sale(sale, product_sales=None):
+    """Llamar dentro de la transacción de la venta; `product_sales` es {product_id: (unidades, ingresos)}"""
+    date = timezone.localdate(sale.created_at)
+    cashier_id = sale.cash_drawer_session.user_id if sale.cash_drawer_session else None
+    _add_to_summary(
+        date,
+        sale.payment_method,
+        cashier_id,
+        sale_count=1,
+        total_amount=sale.total_amount
+    )
+    _add_to_product_sales(date, product_sales)
+
+
+def record_refund(sale_return, payment_method, product_refunds=None):
+    """
+    Llamar dentro de la transacción de la devolución; se imputa al día y cajero
+    que la procesa. `product_refunds` es {product_id: (unidades, importe)} devueltos.
+    """
+    date = timezone.localdate(sale_return.returned_at)
+    _add_to_summary(
+        date,
+        payment_method,
+        sale_return.processed_by_id,
+        refund_count=1,
+        refund_amount=sale_return.total_refund
+    )
+    _add_to_product_sales(date, {
+        product_id: (-units, -amount) for product_id, (units, amount) in (product_refunds or {}).items()
+    })
+
+
+def get_top_products(days=7, limit=5, today=None):
+    """
+    Productos más vendidos en los últimos `days` días (incluido hoy) leyendo
+    los contadores diarios: el costo depende de productos x días, no de SaleItem.
+    """
+    today = today or timezone.localdate()
+    top = list(
+        ProductDailySales.objects.filter(date__gt=today - timezone.timedelta(days=days), date__lte=today)
+        .values('product')
+        .annotate(total_sold=Sum('units'), total_revenue=Sum('revenue'))
+        .filter(total_sold__gt=0)
+        .order_by('-total_sold', '-total_revenue')[:limit]
+    )
+    # Los nombres se buscan solo para los `limit` ganadores
+    names = dict(Product.objects.filter(pk__in=[row['product'] for row in top]).values_list('pk', 'name'))
+    for row in top:
+        row['product_name'] = names.get(row['product'])
+    return top
+
+
+def get_sales_totals(today, week_ago):
+    """Totales de ventas del día y de la semana leyendo solo el resumen diario"""
+    totals = DailySalesSummary.objects.filter(date__gte=week_ago, date__lte=today).aggregate(
+        today_sales=Sum('total_amount', filter=Q(date=today)),
+        today_transactions=Sum('sale_count', filter=Q(date=today)),
+        week_sales=Sum('total_amount'),
+        cash_sales_today=Sum('total_amount', filter=Q(date=today, payment_method='cash')),
+        card_sales_today=Sum('total_amount', filter=Q(date=today, payment_method='card')),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def rebuild_daily_summary(start_date=None, end_date=None):
+    """Recalcula el resumen desde Sale y SaleReturn (todo el historial o un rango de fechas)"""
+    tz = timezone.get_current_timezone()
+    sales = Sale.objects.filter(date_range_q('created_at', start_date, end_date))
+    returns = SaleReturn.objects.filter(date_range_q('returned_at', start_date, end_date))
+    existing = DailySalesSummary.objects.all()
+    if start_date:
+        existing = existing.filter(date__gte=start_date)
+    if end_date:
+        existing = existing.filter(date__lte=end_date)
+
+    rows = defaultdict(lambda: {
+        'sale_count': 0, 'total_amount': Decimal('0'), 'refund_count': 0, 'refund_amount': Decimal('0')
+    })
+
+    sale_groups = sales.annotate(day=TruncDate('created_at', tzinfo=tz)).values(
+        'day', 'payment_method', 'cash_drawer_session__user'
+    ).annotate(count=Count('id'), total=Sum('total_amount')).order_by()
+    for group in sale_groups:
+        row = rows[(group['day'], group['payment_method'], group['cash_drawer_session__user'])]
+        row['sale_count'] = group['count']
+        row['total_amount'] = group['total'] or 0
+
+    return_groups = returns.annotate(day=TruncDate('returned_at', tzinfo=tz)).values(
+        'day', 'original_sale__payment_method', 'processed_by'
+    ).annotate(count=Count('id'), total=Sum('total_refund')).order_by()
+    for group in return_groups:
+        row = rows[(group['day'], group['original_sale__payment_method'], group['processed_by'])]
+        row['refund_count'] = group['count']
+        row['refund_amount'] = group['total'] or 0
+
+    with transaction.atomic():
+        existing.delete()
+        DailySalesSummary.objects.bulk_create([
+            DailySalesSummary(date=day, payment_method=method, cashier_id=cashier_id, **values)
+            for (day, method, cashier_id), values in rows.items()
+        ])
+    return len(rows)
+
+
+def rebuild_product_sales(start_date=None, end_date=None):
+    """Recalcula los contadores por producto desde SaleItem y SaleReturnItem"""
+    tz = timezone.get_current_timezone()
+    items = SaleItem.objects.filter(date_range_q('sale__created_at', start_date, end_date))
+    returned = SaleReturnItem.objects.filter(date_range_q('return_request__returned_at', start_date, end_date))
+    existing = ProductDailySales.objects.all()
+    if start_date:
+        existing = existing.filter(date__gte=start_date)
+    if end_date:
+        existing = existing.filter(date__lte=end_date)
+
+    rows = defaultdict(lambda: [0, Decimal('0')])
+    revenue = Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+    for group in items.annotate(day=TruncDate('sale__created_at', tzinfo=tz)).values(
+        'day', 'product'
+    ).annotate(units=Sum('quantity'), revenue=revenue).order_by():
+        row = rows[(group['day'], group['product'])]
+        row[0] += group['units']
+        row[1] += group['revenue']
+
+    for group in returned.annotate(day=TruncDate('return_request__returned_at', tzinfo=tz)).values(
+        'day', 'product'
+    ).annotate(units=Sum('quantity'), revenue=revenue).order_by():
+        row = rows[(group['day'], group['product'])]
+        row[0] -= group['units']
+        row[1] -= group['revenue']
+
+    with transaction.atomic():
+        existing.delete()
+        ProductDailySales.objects.bulk_create([
+            ProductDailySales(date=day, product_id=product_id, units=units, revenue=amount)
+            for (day, product_id), (units, amount) in rows.items()
+        ], batch_size=1000)
+    return len(rows)
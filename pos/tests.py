@@ -1,3 +1,1336 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import re
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import sync_to_async
+from reportlab.platypus import Table
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cart import Cart, CartError, load_cart_rows, parse_scan
+from .catalog import ProductIndex, SkuCache, product_index, sku_cache
+from .customer_search import rebuild_customer_search, search_customers
+from .checkout import InsufficientStockError, drain_checkout_queue, process_checkout
+from .dates import date_range_q, day_start
+from .models import (
+    CashDrawerSession, Category, CheckoutQueueEntry, Customer, DailySalesSummary, Product, ProductDailySales, ReportJob, Sale, SaleItem,
+    SaleReturn, StockMovement, StockShard, Supplier
+)
+from .stock import (
+    compact_stock_movements, disable_sharding, enable_sharding, get_available_stock, set_stock_level, shard_count,
+    shard_for
+)
+from .live import metrics_broadcaster, publish_sale
+from .margins import margin_report
+from .metrics import get_dashboard_metrics, invalidate_dashboard_metrics
+from .receipts import decode_receipt_code, encode_receipt_code
+from .returns import ReturnError, process_return
+from .reports import (
+    data_watermark, excel_report_response, run_pending_report_jobs, sales_breakdowns, sales_in_range, write_sales_excel, write_sales_pdf
+)
+from .summary import get_sales_totals, get_top_products, rebuild_daily_summary, rebuild_product_sales
+
+
+def make_cart(products, quantity=1):
+    return [
+        {'product_id': p.id, 'name': p.name, 'sku': p.sku, 'price': str(p.price), 'quantity': quantity}
+        for p in products
+    ]
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.50'), stock=10)
+            for i in range(40)
+        ])
+
+    def test_checkout_discounts_stock_and_creates_items(self):
+        sale = process_checkout(make_cart(self.products[:3], quantity=4), self.session, 'card')
+
+        self.assertEqual(sale.total_amount, Decimal('30.00'))
+        self.assertEqual(sale.items.count(), 3)
+        self.assertEqual(
+            list(get_available_stock([p.id for p in self.products[:3]]).values()),
+            [6, 6, 6]
+        )
+
+    def test_checkout_query_count_does_not_grow_with_cart(self):
+        # La primera venta del día crea la fila del resumen diario
+        process_checkout(make_cart(self.products[:1]), self.session)
+
+        with CaptureQueriesContext(connection) as small:
+            process_checkout(make_cart(self.products[:1]), self.session)
+        with CaptureQueriesContext(connection) as large:
+            process_checkout(make_cart(self.products), self.session)
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_insufficient_stock_rolls_back(self):
+        cart = make_cart(self.products[:2])
+        cart[1]['quantity'] = 11
+
+        with self.assertRaises(InsufficientStockError):
+            process_checkout(cart, self.session)
+
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SaleItem.objects.exists())
+        self.assertEqual(get_available_stock([self.products[0].id]), {self.products[0].id: 10})
+
+
+class CartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.50'), stock=5)
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        sku_cache.clear()
+        self.client.force_login(self.user)
+
+    def scan(self, sku):
+        return self.client.post(reverse('add_product'), {'sku': sku})
+
+    def test_scan_increments_existing_line(self):
+        self.scan('SKU0')
+        self.scan('SKU0')
+
+        self.assertEqual(Cart(self.user).items(), [
+            {'product_id': self.products[0].id, 'name': 'Producto 0', 'sku': 'SKU0', 'price': '2.50', 'quantity': 2}
+        ])
+
+    def test_scan_respects_stock_in_cart(self):
+        for _ in range(5):
+            self.scan('SKU0')
+        response = self.scan('SKU0')
+
+        self.assertContains(response, 'No hay suficiente stock')
+        self.assertEqual(Cart(self.user).get_quantity(self.products[0].id), 5)
+
+    def test_scan_cost_does_not_grow_with_cart(self):
+        self.scan('SKU0')
+        with CaptureQueriesContext(connection) as small:
+            self.scan('SKU0')
+
+        for product in self.products[1:]:
+            self.scan(product.sku)
+        with CaptureQueriesContext(connection) as large:
+            self.scan('SKU0')
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_checkout_clears_cart(self):
+        self.scan('SKU0')
+        self.client.post(reverse('checkout'), {'payment_method': 'cash'})
+
+        self.assertEqual(Cart(self.user).items(), [])
+        self.assertEqual(Sale.objects.get().items.get().quantity, 1)
+
+    def test_deleted_product_is_reported_and_dropped_from_cart(self):
+        self.scan('SKU0')
+        self.scan('SKU1')
+        Product.objects.filter(pk=self.products[0].pk).delete()
+
+        rows, missing = load_cart_rows(Cart(self.user).items())
+        self.assertEqual([row['sku'] for row in rows], ['SKU1'])
+        self.assertEqual([item['name'] for item in missing], ['Producto 0'])
+
+        response = self.client.get(reverse('pos_main'))
+        self.assertContains(response, 'Producto 0 ya no existe')
+        self.assertEqual([item['sku'] for item in Cart(self.user).items()], ['SKU1'])
+
+
+class PosViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.50'), stock=5)
+            for i in range(20)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('pos_main'))  # deja la sesión de caja en la sesión de login
+
+    def render_with_cart(self, products):
+        cart = Cart(self.user)
+        cart.clear()
+        for product in products:
+            cart.add(product)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('pos_main'))
+        self.assertEqual(len(response.context['cart_items']), len(products))
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_is_fixed(self):
+        _, one_line = self.render_with_cart(self.products[:1])
+        _, many_lines = self.render_with_cart(self.products)
+
+        self.assertEqual(one_line, many_lines)
+
+    def test_flags_stale_price(self):
+        Cart(self.user).add(self.products[0])
+        Product.objects.filter(id=self.products[0].id).update(price=Decimal('3.00'))
+
+        response = self.client.get(reverse('pos_main'))
+
+        self.assertTrue(response.context['cart_items'][0]['price_changed'])
+        self.assertContains(response, 'Precio actual: $3.00')
+
+
+class SkuCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Leche", sku="LECHE1", price=Decimal('1.20'), stock=5)
+
+    def setUp(self):
+        sku_cache.clear()
+
+    def test_second_lookup_is_served_from_cache(self):
+        sku_cache.get('LECHE1')
+        with self.assertNumQueries(0):
+            cached = sku_cache.get('LECHE1')
+
+        self.assertEqual(cached.price, Decimal('1.20'))
+
+    def test_save_invalidates_entry(self):
+        sku_cache.get('LECHE1')
+        self.product.price = Decimal('1.50')
+        self.product.sku = 'LECHE2'
+        self.product.save()
+
+        self.assertEqual(sku_cache.get('LECHE2').price, Decimal('1.50'))
+        with self.assertRaises(Product.DoesNotExist):
+            sku_cache.get('LECHE1')
+
+    def test_cache_is_bounded(self):
+        small = SkuCache(maxsize=1)
+        Product.objects.create(name="Pan", sku="PAN1", price=Decimal('0.50'))
+        small.get('LECHE1')
+        small.get('PAN1')
+
+        with self.assertNumQueries(1):
+            small.get('LECHE1')
+
+
+class BulkScanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.50'), stock=30)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        sku_cache.clear()
+        self.client.force_login(self.user)
+        self.client.get(reverse('pos_main'))  # deja la sesión de caja en la sesión de login
+
+    def test_quantity_syntax_in_scan_field(self):
+        response = self.client.post(reverse('add_product'), {'sku': '24*SKU0'})
+
+        self.assertContains(response, '<td>24</td>')
+        self.assertEqual(Cart(self.user).get_quantity(self.products[0].id), 24)
+
+    def test_parse_scan_only_splits_on_numeric_quantity(self):
+        self.assertEqual(parse_scan(' 3*SKU1 '), ('SKU1', 3))
+        self.assertEqual(parse_scan('AB*12'), ('AB*12', 1))
+        self.assertEqual(parse_scan('2*AB*12'), ('AB*12', 2))
+        with self.assertRaisesMessage(CartError, "Falta el SKU"):
+            parse_scan('2*')
+        with self.assertRaisesMessage(CartError, "mayor a cero"):
+            parse_scan('0*SKU1')
+
+    def test_sku_with_asterisk_can_be_scanned(self):
+        Product.objects.create(name="Tornillo", sku="TOR*8", price=Decimal('0.10'), stock=10)
+        response = self.client.post(reverse('add_product'), {'sku': 'TOR*8'})
+        self.assertContains(response, 'Tornillo')
+
+    def test_batch_returns_whole_cart(self):
+        Cart(self.user).add(self.products[0], 2)
+
+        response = self.client.post(reverse('add_products_bulk'), {'items': 'SKU0\n3*SKU1\nSKU0'})
+
+        self.assertEqual(
+            [(row['sku'], row['quantity']) for row in response.context['cart_items']],
+            [('SKU0', 4), ('SKU1', 3)]
+        )
+
+    def test_batch_is_all_or_nothing(self):
+        response = self.client.post(reverse('add_products_bulk'), {'sku': ['SKU0', 'SKU1'], 'qty': ['5', '31']})
+
+        self.assertContains(response, 'No hay suficiente stock de Producto 1')
+        self.assertEqual(Cart(self.user).items(), [])
+
+    def test_batch_query_count_does_not_grow(self):
+        with CaptureQueriesContext(connection) as one:
+            self.client.post(reverse('add_products_bulk'), {'items': 'SKU0'})
+        Cart(self.user).clear()
+        with CaptureQueriesContext(connection) as three:
+            self.client.post(reverse('add_products_bulk'), {'items': 'SKU0\nSKU1\nSKU2'})
+
+        self.assertEqual(len(one.captured_queries), len(three.captured_queries))
+
+
+class IdempotentCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.product = Product.objects.create(name="Leche", sku="LECHE1", price=Decimal('1.20'), stock=5)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        Cart(self.user).add(self.product, 2)
+
+    def checkout(self, key='clave-1'):
+        return self.client.post(reverse('checkout'), {'payment_method': 'cash', 'idempotency_key': key})
+
+    def test_resubmission_does_not_duplicate_sale(self):
+        self.checkout()
+        Cart(self.user).add(self.product, 2)
+        self.checkout()
+
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(get_available_stock([self.product.id]), {self.product.id: 3})
+
+    @override_settings(POS_CHECKOUT_MODE='queued')
+    def test_queued_checkout_is_registered_once_by_worker(self):
+        self.checkout()
+        self.checkout()
+
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(CheckoutQueueEntry.objects.get().status, 'pending')
+
+        drain_checkout_queue()
+        drain_checkout_queue()
+
+        entry = CheckoutQueueEntry.objects.get()
+        self.assertEqual(entry.status, 'done')
+        self.assertEqual(entry.sale.idempotency_key, 'clave-1')
+        self.assertEqual(get_available_stock([self.product.id]), {self.product.id: 3})
+
+
+class StockLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.product = Product.objects.create(name="Leche", sku="LECHE1", price=Decimal('1.20'), stock=10)
+
+    def test_sale_inserts_movement_without_touching_snapshot(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 10)
+        self.assertEqual(StockMovement.objects.get().quantity, -3)
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 7)
+
+    def test_compaction_moves_pending_into_snapshot(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+        process_checkout(make_cart([self.product], quantity=2), self.session)
+
+        self.assertEqual(compact_stock_movements(), 1)
+
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 5)
+        self.assertFalse(StockMovement.objects.filter(applied=False).exists())
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 5)
+
+    def test_compaction_only_marks_rows_it_summed(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+        with CaptureQueriesContext(connection) as queries:
+            compact_stock_movements()
+        update = [q['sql'] for q in queries.captured_queries if 'UPDATE "pos_stockmovement"' in q['sql']]
+        # Se marcan los ids leídos, no un rango que pueda incluir filas confirmadas después
+        self.assertEqual(len(update), 1)
+        self.assertIn('"pos_stockmovement"."id" IN', update[0])
+
+    def test_product_rows_are_locked_only_after_the_ledger_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            process_checkout(make_cart([self.product], quantity=3), self.session)
+        sql = [q['sql'] for q in queries.captured_queries]
+        insert = next(i for i, q in enumerate(sql) if q.startswith('INSERT INTO "pos_stockmovement"'))
+        product_reads = [i for i, q in enumerate(sql) if q.startswith('SELECT') and 'FROM "pos_product"' in q]
+        # Una lectura inicial sin bloqueo; el bloqueo y la re-verificación van después de insertar
+        self.assertEqual(len([i for i in product_reads if i < insert]), 1)
+        self.assertEqual(len([i for i in product_reads if i > insert]), 2)
+
+    def test_checkout_compacts_at_most_once_per_interval(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            process_checkout(make_cart([self.product], quantity=3), self.session)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_checkout(make_cart([self.product], quantity=2), self.session)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 7)
+        self.assertEqual(StockMovement.objects.filter(applied=False).count(), 1)
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 5)
+
+    def test_adjusted_product_can_be_deleted(self):
+        set_stock_level(self.product, 4)
+        self.product.delete()
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_admin_stock_edit_records_adjustment(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+        admin_user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(admin_user)
+
+        self.client.post(reverse('admin:pos_product_change', args=[self.product.id]), {
+            'name': 'Leche', 'sku': 'LECHE1', 'price': '1.20', 'cost': '', 'stock': '20',
+            'category': '', 'supplier': '',
+        })
+
+        adjustment = StockMovement.objects.get(kind='adjustment')
+        self.assertEqual(adjustment.quantity, 13)
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 20)
+
+    def _post_changelist(self, stock, shown, price='1.20'):
+        return self.client.post(reverse('admin:pos_product_changelist'), {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1',
+            'form-0-id': str(self.product.id), 'form-0-price': price,
+            'form-0-stock': str(stock), 'initial-form-0-stock': str(shown), '_save': 'Guardar',
+        })
+
+    def test_changelist_edits_available_stock(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+        response = self.client.get(reverse('admin:pos_product_changelist'))
+        self.assertContains(response, 'name="form-0-stock" value="7"')
+
+        # El encargado cuenta 10 unidades: el ajuste es contra el disponible, no contra el snapshot
+        self.assertEqual(self._post_changelist(10, shown=7).status_code, 302)
+        self.assertEqual(StockMovement.objects.get(kind='adjustment').quantity, 3)
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 10)
+
+    def test_changelist_price_edit_keeps_stock_sold_meanwhile(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        # Venta entre que se muestra el listado (7) y se guarda
+        process_checkout(make_cart([self.product], quantity=1), self.session)
+
+        self._post_changelist(7, shown=7, price='1.50')
+
+        self.assertFalse(StockMovement.objects.filter(kind='adjustment').exists())
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 6)
+        self.assertEqual(Product.objects.get(id=self.product.id).price, Decimal('1.50'))
+
+
+class ShardedStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.product = Product.objects.create(name="Promo", sku="PROMO", price=Decimal('1.00'), stock=16)
+
+    def setUp(self):
+        enable_sharding(self.product)
+        self.product.refresh_from_db()
+
+    def test_total_is_split_across_shards(self):
+        self.assertEqual(StockShard.objects.filter(product=self.product).count(), shard_count())
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 16)
+
+    def test_sale_takes_from_own_shard_and_rebalances_when_short(self):
+        own = shard_for(self.user.id)
+        process_checkout(make_cart([self.product], quantity=2), self.session)
+        self.assertEqual(StockShard.objects.get(product=self.product, shard=own).quantity, 0)
+
+        process_checkout(make_cart([self.product], quantity=5), self.session)
+
+        self.assertEqual(get_available_stock([self.product.id])[self.product.id], 9)
+        self.assertFalse(StockMovement.objects.filter(applied=False).exists())
+
+    def test_sale_over_total_fails(self):
+        with self.assertRaises(InsufficientStockError):
+            process_checkout(make_cart([self.product], quantity=17), self.session)
+
+    def test_low_stock_queries_see_total(self):
+        process_checkout(make_cart([self.product], quantity=10), self.session)
+        low = Product.objects.with_available_stock().filter(available_stock__lt=10)
+
+        self.assertEqual([p.available_stock for p in low], [6])
+
+    def test_disable_folds_shards_into_snapshot(self):
+        process_checkout(make_cart([self.product], quantity=3), self.session)
+        disable_sharding(self.product)
+
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 13)
+        self.assertFalse(StockShard.objects.exists())
+
+
+class ActiveCashSessionCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def drawer_queries(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        return response, [q for q in ctx.captured_queries if 'pos_cashdrawersession' in q['sql']]
+
+    def test_open_session_is_cached_in_login_session(self):
+        self.client.post(reverse('open_session'), {'starting_balance': '50'})
+
+        response, queries = self.drawer_queries(reverse('pos_main'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['active_session'].starting_balance, Decimal('50'))
+        self.assertEqual(queries, [])
+
+    def test_closing_session_invalidates_cache(self):
+        self.client.post(reverse('open_session'), {'starting_balance': '50'})
+        self.client.force_login(self.user)  # close_session_view termina en logout
+        self.client.post(reverse('close_session'), {'ending_balance': '50'})
+        self.client.force_login(self.user)
+
+        response, _ = self.drawer_queries(reverse('pos_main'))
+
+        self.assertRedirects(response, reverse('open_session'))
+
+
+class DailySalesSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero', password='x', is_staff=True)
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.50'), stock=10)
+            for i in range(3)
+        ])
+
+    def summary_rows(self):
+        return list(DailySalesSummary.objects.order_by('payment_method').values(
+            'date', 'payment_method', 'cashier', 'sale_count', 'total_amount', 'refund_count', 'refund_amount'
+        ))
+
+    def test_checkout_and_return_update_summary(self):
+        process_checkout(make_cart(self.products, quantity=2), self.session, 'cash')
+        sale = process_checkout(make_cart(self.products[:1]), self.session, 'card')
+        process_checkout(make_cart(self.products[:1]), self.session, 'card')
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('process_return'), {
+            'sale_id': sale.id, f'return_qty_{sale.items.get().id}': 1
+        })
+
+        cash, card = DailySalesSummary.objects.order_by('payment_method').reverse()
+        self.assertEqual((cash.sale_count, cash.total_amount), (1, Decimal('15.00')))
+        self.assertEqual((card.sale_count, card.total_amount), (2, Decimal('5.00')))
+        self.assertEqual((card.refund_count, card.refund_amount), (1, Decimal('2.50')))
+
+        today = timezone.localdate()
+        totals = get_sales_totals(today, today - timezone.timedelta(days=7))
+        self.assertEqual(totals['today_transactions'], 3)
+        self.assertEqual(totals['cash_sales_today'], Decimal('15.00'))
+
+    def test_rebuild_matches_incremental_rows(self):
+        process_checkout(make_cart(self.products, quantity=2), self.session, 'cash')
+        process_checkout(make_cart(self.products[:2]), self.session, 'card')
+        SaleReturn.objects.create(original_sale=Sale.objects.get(payment_method='cash'), processed_by=self.user, total_refund=5)
+        DailySalesSummary.objects.filter(payment_method='cash').update(refund_count=1, refund_amount=5)
+        incremental = self.summary_rows()
+
+        DailySalesSummary.objects.all().delete()
+        rebuild_daily_summary()
+
+        self.assertEqual(self.summary_rows(), incremental)
+
+    def test_admin_cannot_change_rolled_up_sale_fields(self):
+        sale = process_checkout(make_cart(self.products[:1]), self.session, payment_method='cash')
+        rows = self.summary_rows()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+        self.client.post(reverse('admin:pos_sale_change', args=[sale.id]), {
+            'total_amount': '99.00', 'payment_method': 'card', 'customer': '',
+        })
+        sale.refresh_from_db()
+        self.assertEqual((sale.total_amount, sale.payment_method), (Decimal('2.50'), 'cash'))
+
+        self.assertEqual(self.client.get(reverse('admin:pos_sale_delete', args=[sale.id])).status_code, 403)
+        item = sale.items.get()
+        self.assertEqual(self.client.post(reverse('admin:pos_saleitem_change', args=[item.id]), {
+            'quantity': '5',
+        }).status_code, 403)
+        self.assertEqual(self.summary_rows(), rows)
+
+
+class DashboardMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('admin', password='x', is_staff=True)
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.50'), stock=10)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_metrics_are_memoized_between_loads(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('admin_dashboard'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin_dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'pos_' in q['sql']])
+
+    def test_checkout_invalidates_metrics(self):
+        self.assertEqual(get_dashboard_metrics()['today_transactions'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_checkout(make_cart(self.products), self.session, 'cash')
+
+        metrics = get_dashboard_metrics()
+        self.assertEqual(metrics['today_transactions'], 1)
+        self.assertEqual(metrics['cash_sales_today'], Decimal('7.50'))
+
+
+class DashboardStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('admin', password='x', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_sale_is_pushed_once_to_every_viewer(self):
+        streams = [metrics_broadcaster.stream() for _ in range(3)]
+        for stream in streams:
+            self.assertTrue((await anext(stream)).startswith('event: snapshot'))
+
+        await sync_to_async(publish_sale)(Sale(total_amount=Decimal('12.50'), payment_method='card'))
+
+        for stream in streams:
+            event = await asyncio.wait_for(anext(stream), 1)
+            self.assertEqual(event.splitlines()[0], 'event: sale')
+            self.assertEqual(json.loads(event.splitlines()[1][len('data: '):])['amount'], '12.50')
+            await stream.aclose()
+        self.assertFalse(metrics_broadcaster.has_subscribers())
+
+    @override_settings(POS_DASHBOARD_STREAM_KEEPALIVE=0.05)
+    async def test_idle_stream_resyncs_from_shared_cache(self):
+        stream = metrics_broadcaster.stream()
+        self.assertTrue((await anext(stream)).startswith('event: snapshot'))
+
+        # Venta registrada por otro worker: aquí no llega ningún delta
+        await DailySalesSummary.objects.acreate(
+            date=timezone.localdate(), payment_method='cash', sale_count=1, total_amount=Decimal('30.00')
+        )
+        await sync_to_async(invalidate_dashboard_metrics)()
+
+        event = await asyncio.wait_for(anext(stream), 1)
+        self.assertEqual(event.splitlines()[0], 'event: snapshot')
+        self.assertEqual(Decimal(json.loads(event.splitlines()[1][len('data: '):])['today_sales']), Decimal('30'))
+        await stream.aclose()
+
+    def test_dashboard_marks_sections_for_periodic_refresh(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin_dashboard'))
+        for section in ['top-products', 'stock-alerts', 'today-sessions', 'recent-sales']:
+            self.assertContains(response, f'data-live-section="{section}"')
+
+    def test_wsgi_fallback_sends_snapshot_with_retry(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard_stream'))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertContains(response, 'event: snapshot')
+        self.assertContains(response, 'retry: 15000')
+
+
+class ProductSalesCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('admin', password='x', is_staff=True)
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal(f'{i + 1}.00'), stock=20)
+            for i in range(3)
+        ])
+
+    def counters(self):
+        return dict(ProductDailySales.objects.values_list('product', 'units'))
+
+    def test_checkout_and_return_update_counters(self):
+        cart = make_cart(self.products[:2], quantity=3) + make_cart(self.products[:1], quantity=2)
+        sale = process_checkout(cart, self.session)
+        process_checkout(make_cart(self.products[1:2]), self.session)
+
+        self.client.force_login(self.user)
+        item = sale.items.filter(product=self.products[0]).first()
+        self.client.post(reverse('process_return'), {'sale_id': sale.id, f'return_qty_{item.id}': 1})
+
+        self.assertEqual(self.counters(), {self.products[0].id: 4, self.products[1].id: 4})
+        top = get_top_products(days=1)
+        self.assertEqual([row['product_name'] for row in top], ["Producto 1", "Producto 0"])
+        self.assertEqual(top[0]['total_revenue'], Decimal('8.00'))
+
+    def test_window_excludes_older_days(self):
+        today = timezone.localdate()
+        ProductDailySales.objects.create(
+            date=today - timezone.timedelta(days=10), product=self.products[2], units=50, revenue=150
+        )
+        process_checkout(make_cart(self.products[:1]), self.session)
+
+        self.assertEqual([row['product'] for row in get_top_products(days=7)], [self.products[0].id])
+        self.assertEqual(get_top_products(days=30)[0]['product'], self.products[2].id)
+
+    def test_rebuild_matches_incremental_counters(self):
+        process_checkout(make_cart(self.products, quantity=2), self.session)
+        process_checkout(make_cart(self.products[:1]), self.session)
+        incremental = sorted(ProductDailySales.objects.values_list('date', 'product', 'units', 'revenue'))
+
+        ProductDailySales.objects.all().delete()
+        rebuild_product_sales()
+
+        self.assertEqual(sorted(ProductDailySales.objects.values_list('date', 'product', 'units', 'revenue')), incremental)
+
+
+class ExcelExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('admin', password='x', is_staff=True)
+        session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        Sale.objects.bulk_create([
+            Sale(total_amount=Decimal('10.00'), cash_drawer_session=session, payment_method=method)
+            for method in ['cash', 'card', 'cash']
+        ])
+
+    def test_export_streams_workbook_with_all_rows(self):
+        today = timezone.localdate()
+        response = excel_report_response(sales_in_range(today, today), today, today)
+
+        self.assertTrue(response.streaming)
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.iter_rows(min_row=4, max_row=6, values_only=True))
+        self.assertEqual(sorted(row[3] for row in rows), ['Efectivo', 'Efectivo', 'Tarjeta'])
+        self.assertEqual({row[2] for row in rows}, {'admin'})
+        self.assertEqual(sheet['E8'].value, '=SUM(E4:E6)')
+
+
+class ReportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('admin', password='x', is_staff=True)
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        Sale.objects.create(total_amount=Decimal('10.00'), cash_drawer_session=cls.session)
+
+    def setUp(self):
+        self.reports_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.reports_dir)
+        self.client.force_login(self.user)
+
+    def export(self, kind='export_pdf'):
+        today = timezone.localdate().isoformat()
+        return self.client.post(reverse('sales_report'), {'start_date': today, 'end_date': today, kind: '1'})
+
+    def test_artifact_is_reused_until_sales_change(self):
+        with self.settings(POS_REPORTS_DIR=self.reports_dir, POS_REPORT_MODE='sync'):
+            first = self.export()
+            job = ReportJob.objects.get()
+            self.assertRedirects(first, reverse('report_job_download', args=[job.id]), fetch_redirect_response=False)
+
+            self.export()
+            self.assertEqual(ReportJob.objects.count(), 1)
+
+            Sale.objects.create(total_amount=Decimal('5.00'), cash_drawer_session=self.session)
+            self.export()
+
+            new_job = ReportJob.objects.get()
+            self.assertNotEqual(new_job.id, job.id)
+            response = self.client.get(reverse('report_job_download', args=[new_job.id]))
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_edited_sale_changes_watermark(self):
+        today = timezone.localdate()
+        before = data_watermark(today, today)
+        sale = Sale.objects.get()
+
+        sale.total_amount = Decimal('12.00')
+        sale.save()
+        after_total = data_watermark(today, today)
+        self.assertNotEqual(after_total, before)
+
+        sale.payment_method = 'card'
+        sale.save()
+        self.assertNotEqual(data_watermark(today, today), after_total)
+
+    def test_abandoned_running_job_is_requeued(self):
+        with self.settings(POS_REPORTS_DIR=self.reports_dir, POS_REPORT_JOB_TIMEOUT=600):
+            self.export()
+            job = ReportJob.objects.get()
+            # El worker que lo tomó murió hace 11 minutos
+            ReportJob.objects.filter(pk=job.pk).update(
+                status='running', started_at=timezone.now() - timezone.timedelta(minutes=11)
+            )
+
+            response = self.export()
+            self.assertRedirects(response, reverse('report_job_status', args=[job.id]))
+            self.assertEqual(ReportJob.objects.get().status, 'pending')
+            self.assertEqual(run_pending_report_jobs(workers=1), 1)
+            self.assertEqual(ReportJob.objects.get().status, 'done')
+
+    def test_recent_running_job_is_left_alone(self):
+        with self.settings(POS_REPORTS_DIR=self.reports_dir):
+            self.export()
+            ReportJob.objects.update(status='running', started_at=timezone.now())
+            self.export()
+            self.assertEqual(ReportJob.objects.get().status, 'running')
+            self.assertEqual(run_pending_report_jobs(workers=1), 0)
+
+    def test_default_mode_leaves_job_for_worker(self):
+        with self.settings(POS_REPORTS_DIR=self.reports_dir):
+            # Modo por defecto: la petición solo encola
+            response = self.export('export_excel')
+            job = ReportJob.objects.get()
+            self.assertRedirects(response, reverse('report_job_status', args=[job.id]))
+            self.assertEqual(job.status, 'pending')
+
+            self.assertEqual(run_pending_report_jobs(workers=1), 1)
+
+            status = self.client.get(reverse('report_job_status', args=[job.id]), HTTP_HX_REQUEST='true')
+            self.assertContains(status, reverse('report_job_download', args=[job.id]))
+
+
+class PdfReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        session = CashDrawerSession.objects.create(user=User.objects.create_user('admin'), starting_balance=0)
+        Sale.objects.bulk_create([
+            Sale(total_amount=Decimal('2.00'), cash_drawer_session=session) for _ in range(75)
+        ])
+
+    def test_rows_are_split_into_pages_with_fixed_queries(self):
+        today = timezone.localdate()
+        output = io.BytesIO()
+        with CaptureQueriesContext(connection) as queries:
+            write_sales_pdf(sales_in_range(today, today), today, today, output)
+
+        # La primera página lleva título y resumen; las siguientes, solo filas
+        self.assertEqual(len(re.findall(rb'/Type /Page\b(?!s)', output.getvalue())), 3)
+        self.assertEqual(len(queries.captured_queries), 2)
+
+    def test_tables_stay_above_footer(self):
+        today = timezone.localdate()
+        sale_ids = list(Sale.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        bottoms = []
+        draw_on = Table.drawOn
+
+        def record(table, canvas, x, y, *args, **kwargs):
+            bottoms.append(y)
+            return draw_on(table, canvas, x, y, *args, **kwargs)
+
+        # Cualquier cantidad de filas, incluidas las que llenan justo una página con el total
+        with mock.patch.object(Table, 'drawOn', record):
+            for count in range(1, len(sale_ids) + 1):
+                sales = sales_in_range(today, today).filter(pk__in=sale_ids[:count])
+                write_sales_pdf(sales, today, today, io.BytesIO())
+                self.assertGreaterEqual(min(bottoms), 30, f"{count} ventas")
+                bottoms.clear()
+
+
+class SalesReportPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('admin', password='x', is_staff=True)
+        session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        Sale.objects.bulk_create([
+            Sale(total_amount=Decimal('1.00'), cash_drawer_session=session) for _ in range(120)
+        ])
+        # Empates en created_at: el id desempata el keyset
+        Sale.objects.update(created_at=timezone.now())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.today = timezone.localdate().isoformat()
+
+    def test_report_renders_first_page_with_db_totals(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('sales_report'), {'start_date': self.today, 'end_date': self.today})
+
+        self.assertEqual(len(response.context['sales']), 50)
+        self.assertEqual(response.context['total_transactions'], 120)
+        self.assertEqual(response.context['total_sales'], Decimal('120.00'))
+        self.assertContains(response, 'sales-load-more')
+        # Totales + página + 4 desgloses agregados
+        self.assertEqual(len([q for q in queries.captured_queries if 'pos_sale' in q['sql']]), 6)
+
+    def test_load_more_walks_every_sale_once(self):
+        response = self.client.post(reverse('sales_report'), {'start_date': self.today, 'end_date': self.today})
+        seen = [sale.id for sale in response.context['sales']]
+        cursor = response.context['next_cursor']
+
+        while cursor:
+            response = self.client.get(reverse('sales_report_rows'), {
+                'start_date': self.today, 'end_date': self.today, 'after': cursor
+            })
+            seen += [sale.id for sale in response.context['sales']]
+            cursor = response.context['next_cursor']
+
+        self.assertEqual(seen, sorted(Sale.objects.values_list('id', flat=True), reverse=True))
+
+
+class DateRangeIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero_idx', password='x')
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.product = Product.objects.create(name='Lápiz', sku='IDX-1', price=Decimal('1.00'))
+
+    def test_date_range_q_uses_local_day_bounds(self):
+        today = timezone.localdate()
+        start = day_start(today)
+        inside = Sale.objects.create(total_amount=1, cash_drawer_session=self.session)
+        before = Sale.objects.create(total_amount=1, cash_drawer_session=self.session)
+        after = Sale.objects.create(total_amount=1, cash_drawer_session=self.session)
+        Sale.objects.filter(pk=inside.pk).update(created_at=start)
+        Sale.objects.filter(pk=before.pk).update(created_at=start - timezone.timedelta(microseconds=1))
+        Sale.objects.filter(pk=after.pk).update(created_at=day_start(today + timezone.timedelta(days=1)))
+
+        ids = set(Sale.objects.filter(date_range_q('created_at', today, today)).values_list('id', flat=True))
+        self.assertEqual(ids, {inside.pk})
+
+    def test_range_filters_do_not_wrap_the_column(self):
+        today = timezone.localdate()
+        sql = str(sales_in_range(today, today).query)
+        self.assertNotIn('django_datetime_cast_date', sql)
+
+    def test_query_plans_use_index_pack(self):
+        today = timezone.localdate()
+        by_payment = Sale.objects.filter(date_range_q('created_at', today, today), payment_method='cash')
+        self.assertIn('sale_created_at_payment_idx', by_payment.explain())
+        self.assertIn('saleitem_product_sale_idx', SaleItem.objects.filter(product=self.product).values('sale').explain())
+        history = CashDrawerSession.objects.filter(user=self.user, end_time__isnull=False).order_by('end_time')
+        self.assertIn('cashdrawer_user_end_time_idx', history.explain())
+
+
+class SalesBreakdownTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', password='x', is_staff=True)
+        cls.beto = User.objects.create_user('beto', password='x')
+        ana_session = CashDrawerSession.objects.create(user=cls.ana, starting_balance=0)
+        beto_session = CashDrawerSession.objects.create(user=cls.beto, starting_balance=0)
+        cls.today = timezone.localdate()
+        yesterday = cls.today - timezone.timedelta(days=1)
+
+        def sale(day, hour, amount, method, session):
+            sale = Sale.objects.create(total_amount=amount, payment_method=method, cash_drawer_session=session)
+            created_at = day_start(day) + timezone.timedelta(hours=hour, minutes=30)
+            Sale.objects.filter(pk=sale.pk).update(created_at=created_at)
+
+        sale(yesterday, 9, Decimal('10.00'), 'cash', ana_session)
+        sale(cls.today, 9, Decimal('20.00'), 'card', ana_session)
+        sale(cls.today, 18, Decimal('5.00'), 'cash', beto_session)
+        cls.start = yesterday
+
+    def breakdowns(self):
+        return {title: rows for title, _, rows in sales_breakdowns(sales_in_range(self.start, self.today))}
+
+    def test_groups_by_local_day_hour_cashier_and_method(self):
+        with self.assertNumQueries(4):
+            breakdowns = self.breakdowns()
+
+        self.assertEqual(
+            [(row['label'], row['count'], row['total']) for row in breakdowns['Por día']],
+            [(self.start.strftime('%d/%m/%Y'), 1, Decimal('10.00')),
+             (self.today.strftime('%d/%m/%Y'), 2, Decimal('25.00'))]
+        )
+        self.assertEqual(
+            [(row['label'], row['count']) for row in breakdowns['Por hora']], [('09:00', 2), ('18:00', 1)]
+        )
+        self.assertEqual(
+            [(row['label'], row['total'], row['average']) for row in breakdowns['Por cajero']],
+            [('ana', Decimal('30.00'), Decimal('15.00')), ('beto', Decimal('5.00'), Decimal('5.00'))]
+        )
+        self.assertEqual(
+            [(row['label'], row['total']) for row in breakdowns['Por método de pago']],
+            [('Tarjeta', Decimal('20.00')), ('Efectivo', Decimal('15.00'))]
+        )
+
+    def test_excel_has_one_sheet_per_breakdown(self):
+        fileobj = io.BytesIO()
+        write_sales_excel(sales_in_range(self.start, self.today), self.start, self.today, fileobj)
+        fileobj.seek(0)
+        wb = openpyxl.load_workbook(fileobj)
+
+        self.assertEqual(wb.sheetnames[1:], ['Por día', 'Por hora', 'Por cajero', 'Por método de pago'])
+        rows = list(wb['Por cajero'].iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('Cajero', 'Transacciones', 'Total', 'Ticket Promedio'))
+        self.assertEqual(rows[1], ('ana', 2, 30, 15))
+
+    def test_report_page_shows_breakdowns(self):
+        self.client.force_login(self.ana)
+        response = self.client.post(reverse('sales_report'), {
+            'start_date': self.start.isoformat(), 'end_date': self.today.isoformat()
+        })
+        self.assertContains(response, 'Desglose del Periodo')
+        self.assertContains(response, 'Por método de pago')
+
+
+class MarginReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gerente', password='x', is_staff=True)
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        drinks = Category.objects.create(name='Bebidas')
+        supplier = Supplier.objects.create(name='Distribuidora')
+        cls.soda = Product.objects.create(
+            name='Refresco', sku='REF', price=Decimal('2.00'), cost=Decimal('1.20'), stock=50,
+            category=drinks, supplier=supplier
+        )
+        cls.water = Product.objects.create(
+            name='Agua', sku='AGU', price=Decimal('1.00'), cost=Decimal('0.40'), stock=50, category=drinks
+        )
+        cls.gum = Product.objects.create(name='Chicle', sku='CHI', price=Decimal('0.50'), stock=50)
+        cls.today = timezone.localdate()
+
+    def test_checkout_snapshots_cost(self):
+        sale = process_checkout(make_cart([self.soda, self.gum]), self.session)
+        costs = dict(sale.items.values_list('product_id', 'unit_cost'))
+        self.assertEqual(costs, {self.soda.id: Decimal('1.20'), self.gum.id: None})
+
+    def test_margins_use_cost_at_sale_time(self):
+        process_checkout(make_cart([self.soda], quantity=10), self.session)
+        Product.objects.filter(pk=self.soda.pk).update(cost=Decimal('1.90'))
+        process_checkout(make_cart([self.water, self.gum], quantity=5), self.session)
+        # Venta anterior a la foto de costo: usa el costo actual del producto
+        SaleItem.objects.filter(product=self.water).update(unit_cost=None)
+
+        with self.assertNumQueries(4):
+            report = margin_report(self.today, self.today)
+
+        totals = report['totals']
+        self.assertEqual(totals['revenue'], Decimal('27.50'))
+        self.assertEqual(totals['cost'], Decimal('14.00'))
+        self.assertEqual(totals['margin'], Decimal('11.00'))
+        self.assertEqual(totals['uncosted_revenue'], Decimal('2.50'))
+
+        by_product = {row['label']: row for row in report['groups'][0][2]}
+        self.assertEqual(by_product['Refresco']['margin'], Decimal('8.00'))
+        self.assertEqual(by_product['Refresco']['margin_percent'], Decimal('40'))
+        self.assertIsNone(by_product['Chicle']['margin_percent'])
+
+        by_category = {row['label']: row['margin'] for row in report['groups'][1][2]}
+        self.assertEqual(by_category, {'Bebidas': Decimal('11.00'), 'Sin asignar': Decimal('0')})
+        by_supplier = [row['label'] for row in report['groups'][2][2]]
+        self.assertEqual(by_supplier, ['Distribuidora', 'Sin asignar'])
+
+    def test_returned_units_leave_the_margin(self):
+        sale = process_checkout(make_cart([self.soda], quantity=10), self.session)
+        item = sale.items.get()
+        process_return(sale, {item.id: 4}, self.user)
+
+        totals = margin_report(self.today, self.today)['totals']
+        self.assertEqual(totals['units'], 6)
+        self.assertEqual(totals['revenue'], Decimal('12.00'))
+        self.assertEqual(totals['cost'], Decimal('7.20'))
+        self.assertEqual(totals['margin'], Decimal('4.80'))
+
+        process_return(sale, {item.id: 6}, self.user)
+        totals = margin_report(self.today, self.today)['totals']
+        self.assertEqual((totals['revenue'], totals['margin']), (Decimal('0'), Decimal('0')))
+
+    def test_margin_view(self):
+        process_checkout(make_cart([self.soda]), self.session)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('margin_report'), {
+            'start_date': self.today.isoformat(), 'end_date': self.today.isoformat()
+        })
+        self.assertContains(response, 'Margen Bruto')
+        self.assertContains(response, 'Distribuidora')
+
+
+class CustomerSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero_clientes', password='x')
+        CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.jose = Customer.objects.create(name='José Pérez', tax_id='0912345678', email='jperez@correo.com')
+        cls.ana = Customer.objects.create(name='Ana Torres', tax_id='1700000001', email='ana@perezsa.com')
+        Customer.objects.create(name='Comercial Andes', tax_id='1790011122001')
+
+    def names(self, text):
+        return [customer.name for customer in search_customers(text)]
+
+    def test_prefix_search_across_fields_ranks_name_first(self):
+        self.assertEqual(self.names('jose'), ['José Pérez'])
+        self.assertEqual(self.names('0912'), ['José Pérez'])
+        self.assertEqual(self.names('ana tor'), ['Ana Torres'])
+        # Coincidencia en el nombre antes que en el email
+        self.assertEqual(self.names('perez'), ['José Pérez', 'Ana Torres'])
+
+    def test_odd_input_does_not_break_the_query(self):
+        self.assertEqual(self.names('"'), [])
+        self.assertEqual(self.names('AND OR *'), [])
+        with self.assertNumQueries(1):
+            self.names('ana')
+
+    def test_triggers_keep_index_in_sync(self):
+        self.jose.name = 'José Zambrano'
+        self.jose.save()
+        self.assertEqual(self.names('zambrano'), ['José Zambrano'])
+        self.assertEqual(self.names('jperez'), ['José Zambrano'])
+
+        self.ana.delete()
+        self.assertEqual(self.names('torres'), [])
+
+        Customer.objects.create(name='Luis Vera')
+        self.assertEqual(self.names('ver'), ['Luis Vera'])
+
+    def test_rebuild_and_view(self):
+        self.assertTrue(rebuild_customer_search())
+        self.assertEqual(self.names('andes'), ['Comercial Andes'])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search_customers'), {'q': 'comer'})
+        self.assertContains(response, 'Comercial Andes')
+
+
+class ProductIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero_productos', password='x')
+        CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.tomato = Product.objects.create(name='Tomate riñón', sku='VER-001', price=Decimal('0.80'))
+        cls.banana = Product.objects.create(name='Plátano verde', sku='VER-002', price=Decimal('0.25'))
+        cls.juice = Product.objects.create(name='Jugo de tomate', sku='BEB-010', price=Decimal('1.50'))
+
+    def setUp(self):
+        product_index.clear()
+
+    def names(self, text, index=product_index):
+        return [product.name for product in index.search(text)]
+
+    def test_prefix_matches_name_and_sku_without_accents(self):
+        self.assertEqual(self.names('tom'), ['Tomate riñón', 'Jugo de tomate'])
+        self.assertEqual(self.names('platano'), ['Plátano verde'])
+        self.assertEqual(self.names('ver-002'), ['Plátano verde'])
+        self.assertEqual(self.names('jugo tom'), ['Jugo de tomate'])
+
+    def test_fuzzy_matches_typos(self):
+        self.assertEqual(self.names('tomte'), ['Jugo de tomate', 'Tomate riñón'])
+        self.assertEqual(self.names('xyz'), [])
+
+    def test_searches_do_not_query_after_first_load(self):
+        index = ProductIndex()
+        with self.assertNumQueries(1):
+            self.names('tom', index)
+        with self.assertNumQueries(0):
+            self.names('plat', index)
+            self.names('jugo', index)
+
+    def test_signals_update_loaded_index(self):
+        self.names('tom')
+        self.tomato.name = 'Tomate cherry'
+        self.tomato.save()
+        Product.objects.create(name='Tomatillo', sku='VER-003', price=Decimal('0.60'))
+        self.juice.delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('tom'), ['Tomate cherry', 'Tomatillo'])
+            self.assertEqual(self.names('riñon'), [])
+
+    def test_expired_index_is_rebuilt_off_the_request_path(self):
+        index = ProductIndex()
+        self.names('tom', index)
+        index._expires_at = 1  # TTL vencido
+
+        with mock.patch.object(index, '_refresh_in_background') as refresh, self.assertNumQueries(0):
+            self.assertEqual(self.names('tom', index), ['Tomate riñón', 'Jugo de tomate'])
+            self.names('plat', index)
+        # Una sola reconstrucción aunque lleguen varias búsquedas
+        refresh.assert_called_once()
+
+    def test_signal_during_rebuild_is_not_lost(self):
+        self.names('tom')
+        load_rows = ProductIndex._load_rows
+
+        def stale_snapshot(index):
+            rows = load_rows(index)
+            # El cambio llega después de leer la BD y antes del reemplazo
+            self.tomato.name = 'Tomate cherry'
+            self.tomato.save()
+            return rows
+
+        with mock.patch.object(ProductIndex, '_load_rows', stale_snapshot):
+            product_index.refresh()
+
+        self.assertEqual(self.names('cherry'), ['Tomate cherry'])
+        self.assertEqual(self.names('riñon'), [])
+
+    def test_search_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search_products'), {'product_search': 'platan'})
+        self.assertContains(response, "addProductBySku('VER\\u002D002')")
+
+
+class ReturnTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero_devoluciones', password='x')
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Producto {i}", sku=f"SKU{i}", price=Decimal('2.00'), stock=10)
+            for i in range(10)
+        ])
+
+    def test_returns_accumulate_and_cannot_exceed_sold(self):
+        sale = process_checkout(make_cart(self.products[:1], quantity=3), self.session)
+        item = sale.items.get()
+
+        sale_return = process_return(sale, {item.id: 2}, self.user)
+        self.assertEqual(sale_return.total_refund, Decimal('4.00'))
+
+        with self.assertRaisesMessage(ReturnError, 'No se puede devolver más de 1 unidades'):
+            process_return(sale, {item.id: 2}, self.user)
+
+        item.refresh_from_db()
+        self.assertEqual(item.returned_quantity, 2)
+        self.assertEqual(get_available_stock([self.products[0].id])[self.products[0].id], 9)
+        self.assertEqual(SaleReturn.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        # La primera devolución del día crea la fila del resumen diario
+        warmup = process_checkout(make_cart(self.products[:1]), self.session)
+        process_return(warmup, {warmup.items.get().id: 1}, self.user)
+
+        small = process_checkout(make_cart(self.products[:1]), self.session)
+        large = process_checkout(make_cart(self.products), self.session)
+
+        with CaptureQueriesContext(connection) as one:
+            process_return(small, {item.id: 1 for item in small.items.all()}, self.user)
+        with CaptureQueriesContext(connection) as ten:
+            process_return(large, {item.id: 1 for item in large.items.all()}, self.user)
+
+        self.assertEqual(len(one.captured_queries), len(ten.captured_queries))
+
+    def test_rejects_items_from_other_sales(self):
+        sale = process_checkout(make_cart(self.products[:1]), self.session)
+        other = process_checkout(make_cart(self.products[1:2]), self.session)
+
+        with self.assertRaisesMessage(ReturnError, 'Item de venta no encontrado'):
+            process_return(sale, {other.items.get().id: 1}, self.user)
+        self.assertFalse(SaleReturn.objects.exists())
+
+    def test_database_rejects_over_return(self):
+        sale = process_checkout(make_cart(self.products[:1], quantity=2), self.session)
+        with self.assertRaises(IntegrityError):
+            SaleItem.objects.filter(sale=sale).update(returned_quantity=3)
+
+    def test_view_reports_errors(self):
+        sale = process_checkout(make_cart(self.products[:1]), self.session)
+        item = sale.items.get()
+        self.client.force_login(self.user)
+        self.client.get(reverse('pos_main'))
+
+        self.client.post(reverse('process_return'), {'sale_id': sale.id, f'return_qty_{item.id}': 1})
+        response = self.client.post(
+            reverse('process_return'), {'sale_id': sale.id, f'return_qty_{item.id}': 1}, follow=True
+        )
+        self.assertContains(response, 'No se puede devolver más de 0 unidades')
+        self.assertEqual(SaleReturn.objects.count(), 1)
+
+
+class ReceiptLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cajero_recibos', password='x')
+        cls.session = CashDrawerSession.objects.create(user=cls.user, starting_balance=0)
+        cls.product = Product.objects.create(name='Leche', sku='LEC', price=Decimal('1.00'), stock=10)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.client.get(reverse('pos_main'))
+        self.sale = process_checkout(make_cart([self.product], quantity=3), self.session)
+
+    def lookup(self, code):
+        return self.client.get(reverse('search_sale_return'), {'sale_id': code})
+
+    def test_code_round_trip_and_check_digit(self):
+        code = encode_receipt_code(1234, 7)
+        self.assertEqual(len(code), 13)
+        self.assertEqual(decode_receipt_code(code), (7, 1234))
+        typo = code[:5] + str((int(code[5]) + 1) % 10) + code[6:]
+        self.assertIsNone(decode_receipt_code(typo))
+        self.assertIsNone(decode_receipt_code('12345'))
+
+    def test_scanned_code_and_plain_id_find_the_sale(self):
+        response = self.lookup(self.sale.receipt_code)
+        self.assertContains(response, f'Detalles de Venta #{self.sale.id}')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(self.lookup(str(self.sale.id)), self.sale.receipt_code)
+
+    def test_code_from_another_terminal_is_rejected(self):
+        wrong_terminal = encode_receipt_code(self.sale.id, self.session.id + 1)
+        self.assertContains(self.lookup(wrong_terminal), 'No se encontró la venta')
+        self.assertContains(self.lookup('abc'), 'inválido')
+
+    def test_fragment_is_cached_until_a_return(self):
+        self.lookup(self.sale.receipt_code)
+        with CaptureQueriesContext(connection) as cached:
+            response = self.lookup(self.sale.receipt_code)
+        self.assertFalse([q for q in cached.captured_queries if 'pos_sale' in q['sql']])
+        self.assertContains(response, 'max="3"')
+
+        item = self.sale.items.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            process_return(self.sale, {item.id: 1}, self.user)
+        self.assertContains(self.lookup(self.sale.receipt_code), 'max="2"')
+
+
+class AdminDashboardButtonTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('superadmin', password='x')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def test_button_comes_from_templates_on_every_changelist(self):
+        # SaleReturn se registra al final de admin.py: antes quedaba sin botón
+        for name in ['product', 'sale', 'salereturn', 'salereturnitem']:
+            response = self.client.get(reverse(f'admin:pos_{name}_changelist'))
+            self.assertTemplateUsed(response, 'admin/pos_dashboard_button.html')
+            # Botón fijo del encabezado + botón sobre el listado
+            self.assertContains(response, 'VOLVER AL DASHBOARD PRINCIPAL', count=2)
+
+    def test_index_shows_header_and_banner_buttons(self):
+        response = self.client.get(reverse('admin:index'))
+        self.assertContains(response, 'VOLVER AL DASHBOARD PRINCIPAL', count=2)
+        # El resto del índice de contrib se mantiene: acciones recientes y sin barra lateral
+        self.assertContains(response, 'id="recent-actions-module"')
+        self.assertContains(response, 'admin/css/dashboard.css')
+        self.assertNotContains(response, 'id="nav-sidebar"')
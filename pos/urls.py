@@ -5,13 +5,20 @@ urlpatterns = [
     path('', views.home_dispatch_view, name='home_dispatch'),
     path('pos/', views.pos_view, name='pos_main'),
     path('pos/add-product/', views.add_product_view, name='add_product'),
+    path('pos/add-products/', views.add_products_bulk_view, name='add_products_bulk'),
     path('pos/checkout/', views.checkout_view, name='checkout'),
     path('pos/open-session/', views.open_session_view, name='open_session'),
     path('pos/close-session/', views.close_session_view, name='close_session'),
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),  # ← Esta es importante
+    path('dashboard/stream/', views.dashboard_stream_view, name='dashboard_stream'),
     path('reports/sales/', views.sales_report_view, name='sales_report'),
+    path('reports/sales/rows/', views.sales_report_rows_view, name='sales_report_rows'),
+    path('reports/jobs/<int:job_id>/', views.report_job_status_view, name='report_job_status'),
+    path('reports/jobs/<int:job_id>/download/', views.report_job_download_view, name='report_job_download'),
+    path('reports/margins/', views.margin_report_view, name='margin_report'),
     path('logout/', views.custom_logout_view, name='logout'),
     path('pos/search-customers/', views.search_customers_view, name='search_customers'),
+    path('pos/search-products/', views.search_products_view, name='search_products'),
     path('returns/', views.returns_main_view, name='returns_main'),
     path('returns/search-sale/', views.search_sale_for_return_view, name='search_sale_return'),
     path('returns/process/', views.process_return_view, name='process_return'),
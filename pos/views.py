@@ -1,26 +1,38 @@
 # pos/views.py
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
-from .models import Product, Sale, SaleItem, Customer, SaleReturn,SaleReturnItem
+from .models import Product, Sale, Customer
 from django.contrib.auth import logout
 from django.views.decorators.http import require_http_methods
-from django.db.models import Sum, Q, Count, Avg
-from .models import CashDrawerSession
+from django.db.models import Sum
+from .models import CashDrawerSession, CheckoutQueueEntry, ReportJob
+from .checkout import process_checkout, enqueue_checkout, get_sale_by_idempotency_key, CheckoutError
+from .cart import Cart, CartError, load_cart_rows, parse_scan, parse_scan_batch
+from .cash_drawer import forget_active_session, get_active_session, remember_active_session
+from .catalog import product_index, sku_cache
+from .stock import get_available_stock
+from .customer_search import search_customers
+from .margins import margin_report
+from .live import format_event, metrics_broadcaster, metrics_snapshot, publish_snapshot
+from .metrics import get_dashboard_metrics, parse_top_days, invalidate_dashboard_metrics
+from .reports import (
+    report_file_response, request_report, run_report_job, sales_breakdowns, sales_in_range, sales_page, sales_totals
+)
+from .returns import (
+    CSRF_SLOT, ReturnError, parse_return_quantities, parse_sale_lookup, process_return, return_details_html
+)
+from django.template.backends.utils import csrf_input
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils import timezone
 from django.db import transaction
 from datetime import datetime
-import io
-import openpyxl
-from openpyxl.utils import get_column_letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+import os
 
 
 @login_required
@@ -35,29 +47,17 @@ def home_dispatch_view(request):
 def pos_view(request):
     """Vista principal del POS - ahora con carrito Y sesión activa"""
     # Obtener sesión activa del usuario
-    active_session = get_active_session(request.user)
+    active_session = get_active_session(request)
 
-    # Cargar items del carrito si existen
-    cart_items = []
-    total = 0
+    # Cargar items del carrito con sus productos en una sola consulta
+    cart = Cart(request.user)
+    cart_items, missing = load_cart_rows(cart.items())
+    total = sum(item['subtotal'] for item in cart_items)
 
-    if 'cart' in request.session:
-        cart = request.session['cart']
-        for item in cart:
-            try:
-                product = Product.objects.get(id=item['product_id'])
-                cart_items.append({
-                    'name': item['name'],
-                    'sku': item['sku'],
-                    'price': item['price'],
-                    'quantity': item['quantity'],
-                    'subtotal': float(item['price']) * item['quantity'],
-                    'product_obj': product  # Para acceder al stock en template
-                })
-                total += float(item['price']) * item['quantity']
-            except Product.DoesNotExist:
-                # Si el producto fue eliminado, saltarlo
-                continue
+    for item in missing:
+        messages.warning(request, f"⚠️ {item['name']} ya no existe y no se incluirá en la venta")
+    if missing:
+        cart.discard_missing()
 
     return render(request, 'pos/pos_main.html', {
         'cart_items': cart_items,
@@ -72,56 +72,46 @@ def add_product_view(request):
     """Vista HTMX para añadir productos al carrito - CON VALIDACIÓN DE STOCK"""
     try:
         if request.method == "POST":
-            sku = request.POST.get('sku', '').strip()
+            try:
+                # Admite 'SKU' o 'cantidad*SKU'
+                sku, quantity = parse_scan(request.POST.get('sku', ''))
+            except CartError as e:
+                return HttpResponse(f'<tr><td colspan="4" class="error-message">❌ {e}</td></tr>')
 
             if not sku:
                 return HttpResponse('<tr><td colspan="4" class="error-message">Por favor ingresa un SKU</td></tr>')
 
             try:
-                product = Product.objects.get(sku=sku)
+                # Nombre y precio desde la caché por SKU; el stock siempre en vivo
+                product = sku_cache.get(sku)
+                stock = get_available_stock([product.id]).get(product.id)
+                if stock is None:
+                    sku_cache.invalidate(product.id)
+                    raise Product.DoesNotExist
 
                 # ✅ NUEVO: VALIDAR STOCK (Sprint 2)
-                if product.stock <= 0:
+                if stock <= 0:
                     return HttpResponse(
                         '<tr><td colspan="4" class="error-message">❌ Producto sin stock disponible</td></tr>'
                     )
 
-                # Inicializar carrito en sesión si no existe
-                if 'cart' not in request.session:
-                    request.session['cart'] = []
-
                 # Buscar si el producto ya está en el carrito
-                cart = request.session['cart']
-                product_found = False
-
-                for item in cart:
-                    if item['product_id'] == product.id:
-                        # ✅ NUEVO: Validar que no exceda el stock disponible
-                        if item['quantity'] + 1 > product.stock:
-                            return HttpResponse(
-                                f'<tr><td colspan="4" class="error-message">❌ No hay suficiente stock. Stock disponible: {product.stock}</td></tr>'
-                            )
-                        item['quantity'] += 1
-                        product_found = True
-                        break
-
-                # Si no está, añadirlo
-                if not product_found:
-                    cart.append({
-                        'product_id': product.id,
-                        'name': product.name,
-                        'sku': product.sku,
-                        'price': str(product.price),
-                        'quantity': 1
-                    })
-
-                # Guardar carrito en sesión
-                request.session.modified = True
+                cart = Cart(request.user)
+                current_quantity = cart.get_quantity(product.id)
+
+                # ✅ NUEVO: Validar que no exceda el stock disponible
+                if current_quantity + quantity > stock:
+                    return HttpResponse(
+                        f'<tr><td colspan="4" class="error-message">❌ No hay suficiente stock. Stock disponible: {stock}</td></tr>'
+                    )
+
+                # Guardar solo la línea afectada
+                cart.add(product, quantity, current_quantity=current_quantity)
 
                 # ✅ NUEVO: Renderizar fila del producto CON INFO DE STOCK
-                subtotal = float(product.price) * 1
-                stock_class = "no-stock" if product.stock == 0 else "low-stock" if product.stock < 10 else ""
-                stock_text = f"SIN STOCK" if product.stock == 0 else f"Stock bajo: {product.stock} unidades" if product.stock < 10 else f"Stock disponible: {product.stock} unidades"
+                subtotal = float(product.price) * quantity
+                stock_class = "no-stock" if stock == 0 else "low-stock" if stock < 10 else ""
+                stock_text = f"SIN STOCK" if stock == 0 else f"Stock bajo: {stock} unidades" if stock < 10 else f"Stock disponible: {stock} unidades"
 
                 html_response = f"""
                 <tr class="success-row">
@@ -132,7 +122,7 @@ def add_product_view(request):
                         </div>
                     </td>
                     <td>${product.price}</td>
-                    <td>1</td>
+                    <td>{quantity}</td>
                     <td>${subtotal:.2f}</td>
                 </tr>
                 """
@@ -147,6 +137,35 @@ def add_product_view(request):
         return HttpResponse(f'<tr><td colspan="4" class="error-message">Error: {str(e)}</td></tr>')
 
 
+@login_required
+@require_http_methods(["POST"])
+def add_products_bulk_view(request):
+    """Vista HTMX para añadir varias lecturas a la vez (ráfagas del lector o 'cantidad*SKU')"""
+    cart = Cart(request.user)
+    error = None
+
+    # Acepta un texto con una lectura por línea y/o pares sku/qty repetidos
+    lines = request.POST.get('items', '').splitlines()
+    quantities = request.POST.getlist('qty')
+    for index, sku in enumerate(request.POST.getlist('sku')):
+        quantity = quantities[index] if index < len(quantities) else ''
+        lines.append(f"{quantity}*{sku}" if quantity else sku)
+
+    try:
+        entries = parse_scan_batch(lines)
+        if not entries:
+            raise CartError("Por favor ingresa un SKU")
+        cart.add_batch(entries)
+    except CartError as e:
+        error = str(e)
+
+    cart_items, _ = load_cart_rows(cart.items())
+    return render(request, 'pos/partials/cart_rows.html', {
+        'cart_items': cart_items,
+        'error': error,
+    })
+
+
 @login_required
 @transaction.atomic
 def checkout_view(request):
@@ -155,13 +174,26 @@ def checkout_view(request):
         if request.method == "POST":
             payment_method = request.POST.get('payment_method', 'cash')
             customer_id = request.POST.get('customer_id')  # ✅ NUEVO: Obtener cliente
-            active_session = get_active_session(request.user)
+            idempotency_key = request.POST.get('idempotency_key', '').strip()[:64]
+            queued = getattr(settings, 'POS_CHECKOUT_MODE', 'sync') == 'queued'
+
+            # Reenvío de una venta ya procesada (doble clic o corte de red)
+            existing_sale = get_sale_by_idempotency_key(idempotency_key)
+            if existing_sale:
+                messages.success(request, f"✅ Venta #{existing_sale.id} ya estaba registrada")
+                return redirect('pos_main')
+            if queued and idempotency_key and CheckoutQueueEntry.objects.filter(
+                    idempotency_key=idempotency_key).exists():
+                messages.success(request, "✅ La venta ya estaba en cola de registro")
+                return redirect('pos_main')
+
+            active_session = get_active_session(request)
 
             if not active_session:
                 messages.error(request, "❌ No tienes una sesión de caja activa")
                 return redirect('open_session')
 
-            cart = request.session.get('cart', [])
+            cart = Cart(request.user).items()
             if not cart:
                 messages.error(request, "El carrito está vacío")
                 return redirect('pos_main')
@@ -174,52 +206,33 @@ def checkout_view(request):
                 except Customer.DoesNotExist:
                     messages.warning(request, "Cliente no encontrado, continuando sin cliente")
 
-            # Dentro de la transacción atómica
-            with transaction.atomic():
-                # Validar stock
-                for item in cart:
-                    product = Product.objects.select_for_update().get(id=item['product_id'])
-                    if product.stock < item['quantity']:
-                        messages.error(
-                            request,
-                            f"Stock insuficiente para {product.name}. Disponible: {product.stock}, Solicitado: {item['quantity']}"
-                        )
-                        return redirect('pos_main')
-
+            # Modo write-behind: se confirma al terminal y un worker registra la venta
+            if queued and idempotency_key:
+                entry = enqueue_checkout(cart, request.user, active_session, payment_method, customer,
+                                         idempotency_key)
+                Cart(request.user).clear()
                 total_amount = sum(float(item['price']) * item['quantity'] for item in cart)
+                messages.success(request, f"✅ Venta en cola #{entry.id} - Total: ${total_amount:.2f}")
+                return redirect('pos_main')
 
-                # Crear venta CON CLIENTE
-                sale = Sale.objects.create(
-                    total_amount=total_amount,
-                    cash_drawer_session=active_session,
-                    payment_method=payment_method,
-                    customer=customer  # ✅ NUEVO: Asignar cliente
-                )
-
-                # Reducir stock y crear items
-                for item in cart:
-                    product = Product.objects.get(id=item['product_id'])
-                    product.stock -= item['quantity']
-                    product.save()
-
-                    SaleItem.objects.create(
-                        sale=sale,
-                        product=product,
-                        product_name=product.name,
-                        quantity=item['quantity'],
-                        unit_price=item['price']
-                    )
+            # Validación, descuento de stock e items en lote (ver pos/checkout.py)
+            try:
+                sale = process_checkout(cart, active_session, payment_method, customer, idempotency_key)
+            except CheckoutError as e:
+                messages.error(request, str(e))
+                return redirect('pos_main')
+            total_amount = sale.total_amount
 
-            # Limpiar carrito (fuera de la transacción)
-            request.session['cart'] = []
-            request.session.modified = True
+            # Limpiar carrito
+            Cart(request.user).clear()
 
             # Mensaje de confirmación
             if customer:
                 messages.success(request,
-                                 f"✅ Venta #{sale.id} registrada para {customer.name} - Total: ${total_amount:.2f}")
+                                 f"✅ Venta #{sale.id} (recibo {sale.receipt_code}) registrada para {customer.name} - Total: ${total_amount:.2f}")
             else:
-                messages.success(request, f"✅ Venta #{sale.id} registrada - Total: ${total_amount:.2f}")
+                messages.success(request,
+                                 f"✅ Venta #{sale.id} (recibo {sale.receipt_code}) registrada - Total: ${total_amount:.2f}")
 
             return redirect('pos_main')
 
@@ -232,28 +245,24 @@ def checkout_view(request):
 
 @login_required
 def search_customers_view(request):
-    """Vista HTMX para buscar clientes - VERSIÓN CORREGIDA"""
+    """Vista HTMX para buscar clientes (índice FTS5, ver customer_search)"""
     # Obtener query de diferentes posibles nombres de parámetro
     query = request.GET.get('q', '').strip()
     if not query:
         query = request.GET.get('customer_search', '').strip()
 
-    print(f"🔍 Búsqueda de clientes: '{query}'")  # Para debug
-
-    if query:
-        # Buscar por nombre, RUC o email
-        customers = Customer.objects.filter(
-            Q(name__icontains=query) |
-            Q(tax_id__icontains=query) |
-            Q(email__icontains=query)
-        )[:10]  # Limitar a 10 resultados
+    return render(request, 'pos/partials/customer_search_results.html', {
+        'customers': search_customers(query),
+        'query': query
+    })
 
-        print(f"📋 Clientes encontrados: {customers.count()}")  # Para debug
-    else:
-        customers = Customer.objects.none()
 
-    return render(request, 'pos/partials/customer_search_results.html', {
-        'customers': customers,
+@login_required
+def search_products_view(request):
+    """Vista HTMX del buscador de productos por nombre o SKU (índice en memoria, sin BD)"""
+    query = request.GET.get('product_search', '').strip()
+    return render(request, 'pos/partials/product_search_results.html', {
+        'products': product_index.search(query),
         'query': query
     })
 
@@ -261,6 +270,9 @@ def search_customers_view(request):
 @require_http_methods(["GET", "POST"])
 def custom_logout_view(request):
     """Vista personalizada para logout que acepta GET y POST"""
+    # El carrito vive lo mismo que la sesión de login
+    if request.user.is_authenticated:
+        Cart(request.user).clear()
     logout(request)
     return redirect('login')
 
@@ -268,11 +280,8 @@ def custom_logout_view(request):
 @login_required
 def open_session_view(request):
     """Vista para abrir una nueva sesión de caja"""
-    # Verificar si ya tiene una sesión activa
-    active_session = CashDrawerSession.objects.filter(
-        user=request.user,
-        end_time__isnull=True
-    ).first()
+    # Verificar si ya tiene una sesión activa (en la BD: pudo abrirse en otro navegador)
+    active_session = get_active_session(request, fresh=True)
 
     if active_session:
         return redirect('pos_main')
@@ -287,6 +296,7 @@ def open_session_view(request):
                     user=request.user,
                     starting_balance=starting_balance
                 )
+                remember_active_session(request, session)
                 messages.success(request, f"✅ Caja abierta con fondo inicial: ${starting_balance:.2f}")
                 return redirect('pos_main')
             else:
@@ -301,8 +311,8 @@ def open_session_view(request):
 def close_session_view(request):
     """Vista para cerrar la sesión de caja activa"""
     try:
-        # Obtener sesión activa
-        active_session = get_active_session(request.user)
+        # Obtener sesión activa (completa desde la BD: se va a guardar)
+        active_session = get_active_session(request, fresh=True)
 
         if not active_session:
             messages.error(request, "No tienes una sesión de caja activa")
@@ -338,6 +348,7 @@ def close_session_view(request):
                     active_session.ending_balance = ending_balance
                     active_session.notes = notes
                     active_session.save()
+                    forget_active_session(request)
 
                     # Calcular diferencia para el mensaje
                     difference = ending_balance - expected_cash
@@ -370,102 +381,37 @@ def close_session_view(request):
         return redirect('pos_main')
 
 
-def get_active_session(user):
-    """Función auxiliar para obtener sesión activa"""
-    try:
-        return CashDrawerSession.objects.filter(
-            user=user,
-            end_time__isnull=True
-        ).first()
-    except CashDrawerSession.DoesNotExist:
-        return None
-
-
 @staff_member_required
 def admin_dashboard(request):
     """Dashboard del Administrador - MEJORADO"""
-    today = timezone.now().date()
-
-    # Métricas principales
-    today_sales = Sale.objects.filter(created_at__date=today).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-
-    today_transactions = Sale.objects.filter(created_at__date=today).count()
-    today_avg_ticket = today_sales / today_transactions if today_transactions > 0 else 0
-    active_sessions = CashDrawerSession.objects.filter(end_time__isnull=True).count()
-
-    # Métricas de la semana
-    week_ago = today - timezone.timedelta(days=7)
-    week_sales = Sale.objects.filter(created_at__date__gte=week_ago).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-
-    # Ventas por método de pago hoy
-    cash_sales_today = Sale.objects.filter(
-        created_at__date=today,
-        payment_method='cash'
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-
-    card_sales_today = Sale.objects.filter(
-        created_at__date=today,
-        payment_method='card'
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-
-    # Productos más vendidos
-    top_products = SaleItem.objects.values(
-        'product_name'
-    ).annotate(
-        total_sold=Sum('quantity'),
-        total_revenue=Sum('unit_price')
-    ).order_by('-total_sold')[:5]
-
-    # Sesiones de hoy
-    today_sessions = CashDrawerSession.objects.filter(
-        start_time__date=today
-    ).select_related('user')
-
-    # Ventas recientes
-    recent_sales = Sale.objects.select_related(
-        'cash_drawer_session',
-        'cash_drawer_session__user'
-    ).order_by('-created_at')[:10]
-
-    # Productos con stock bajo
-    low_stock_products = Product.objects.filter(stock__lt=10, stock__gt=0).order_by('stock')[:5]
-    out_of_stock_products = Product.objects.filter(stock=0)[:5]
-
-    context = {
-        # Métricas principales
-        'today_sales': today_sales,
-        'today_transactions': today_transactions,
-        'today_avg_ticket': today_avg_ticket,
-        'active_sessions': active_sessions,
-
-        # Nuevas métricas
-        'week_sales': week_sales,
-        'cash_sales_today': cash_sales_today,
-        'card_sales_today': card_sales_today,
-
-        # Datos detallados
-        'top_products': top_products,
-        'today_sessions': today_sessions,
-        'recent_sales': recent_sales,
-        'low_stock_products': low_stock_products,
-        'out_of_stock_products': out_of_stock_products,
-        'today_date': today,
-        'week_ago': week_ago,
-    }
+    context = get_dashboard_metrics(parse_top_days(request.GET.get('top_days')))
 
     return render(request, 'pos/admin_dashboard.html', context)
 
 
+@staff_member_required
+async def dashboard_stream_view(request):
+    """Server-sent events con las cifras del dashboard (requiere servidor ASGI)"""
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI no se mantienen conexiones abiertas: se manda la foto actual
+        # y el navegador reconecta tras el TTL de la caché de métricas
+        retry = getattr(settings, 'POS_DASHBOARD_CACHE_TTL', 15) * 1000
+        snapshot = await sync_to_async(metrics_snapshot)()
+        return HttpResponse(format_event('snapshot', snapshot, retry=retry), content_type='text/event-stream')
+
+    response = StreamingHttpResponse(metrics_broadcaster.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @staff_member_required
 def sales_report_view(request):
     """Reporte de ventas por rango de fechas - CON EXPORTACIÓN"""
-    sales = Sale.objects.none()
-    total_sales = 0
-    total_transactions = 0
+    sales = []
+    totals = {'total_sales': 0, 'total_transactions': 0, 'average_ticket': 0}
+    breakdowns = []
+    next_cursor = None
     start_date = None
     end_date = None
 
@@ -480,17 +426,16 @@ def sales_report_view(request):
                     start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
                     end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-                    sales = Sale.objects.filter(
-                        created_at__date__range=[start_date, end_date]
-                    ).select_related(
-                        'cash_drawer_session',
-                        'cash_drawer_session__user'
-                    ).order_by('-created_at')
+                    # El archivo se genera fuera de la petición (o se reutiliza si ya existe)
+                    kind = 'excel' if 'export_excel' in request.POST else 'pdf'
+                    job = request_report(kind, start_date, end_date, request.user)
+                    if job.status == 'pending' and getattr(settings, 'POS_REPORT_MODE', 'queued') == 'sync':
+                        run_report_job(job.id)
+                        job.refresh_from_db()
 
-                    if 'export_excel' in request.POST:
-                        return generate_excel_report(sales, start_date, end_date)
-                    elif 'export_pdf' in request.POST:
-                        return generate_pdf_report(sales, start_date, end_date)
+                    if job.status == 'done':
+                        return redirect('report_job_download', job_id=job.id)
+                    return redirect('report_job_status', job_id=job.id)
 
                 except ValueError:
                     messages.error(request, "Formato de fecha inválido")
@@ -501,179 +446,87 @@ def sales_report_view(request):
                 start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
                 end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-                sales = Sale.objects.filter(
-                    created_at__date__range=[start_date, end_date]
-                ).select_related(
-                    'cash_drawer_session',
-                    'cash_drawer_session__user'
-                ).order_by('-created_at')
-
-                if sales.exists():
-                    total_sales_result = sales.aggregate(total=Sum('total_amount'))
-                    total_sales = total_sales_result['total'] or 0
-                    total_transactions = sales.count()
+                # Totales en un aggregate y solo la primera página de ventas
+                range_sales = sales_in_range(start_date, end_date)
+                totals = sales_totals(range_sales)
+                breakdowns = sales_breakdowns(range_sales)
+                sales, next_cursor = sales_page(range_sales)
 
             except ValueError:
                 messages.error(request, "Formato de fecha inválido")
 
     context = {
         'sales': sales,
-        'total_sales': total_sales,
-        'total_transactions': total_transactions,
+        **totals,
+        'next_cursor': next_cursor,
+        'breakdowns': breakdowns,
         'start_date': start_date,
         'end_date': end_date,
-        'today': timezone.now().date(),
+        'today': timezone.localdate(),
     }
 
     return render(request, 'pos/sales_report.html', context)
 
 
-def generate_excel_report(sales, start_date, end_date):
-    """Generar reporte en formato Excel"""
-    # Crear libro de trabajo
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Reporte Ventas {start_date} a {end_date}"
-
-    # Título
-    ws.merge_cells('A1:E1')
-    ws['A1'] = f"Reporte de Ventas - {start_date} a {end_date}"
-    ws['A1'].font = openpyxl.styles.Font(size=14, bold=True)
-
-    # Encabezados de tabla
-    headers = ['ID Venta', 'Fecha', 'Vendedor', 'Método Pago', 'Total']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.font = openpyxl.styles.Font(bold=True)
-        cell.fill = openpyxl.styles.PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-
-    # Datos
-    for row, sale in enumerate(sales, 4):
-        ws.cell(row=row, column=1, value=sale.id)
-        ws.cell(row=row, column=2, value=sale.created_at.strftime('%d/%m/%Y %H:%M'))
-
-        # Vendedor
-        vendedor = "N/A"
-        if sale.cash_drawer_session and sale.cash_drawer_session.user:
-            vendedor = sale.cash_drawer_session.user.username
-        ws.cell(row=row, column=3, value=vendedor)
-
-        # Método de pago
-        metodo_pago = 'Efectivo' if sale.payment_method == 'cash' else 'Tarjeta'
-        ws.cell(row=row, column=4, value=metodo_pago)
-
-        ws.cell(row=row, column=5, value=float(sale.total_amount))
-
-    # Ajustar anchos de columna
-    column_widths = [12, 20, 20, 15, 12]
-    for col, width in enumerate(column_widths, 1):
-        column_letter = get_column_letter(col)
-        ws.column_dimensions[column_letter].width = width
-
-    # Totales
-    total_row = len(sales) + 5
-    ws.cell(row=total_row, column=4, value="TOTAL:").font = openpyxl.styles.Font(bold=True)
-    ws.cell(row=total_row, column=5, value=f"=SUM(E4:E{total_row - 1})").font = openpyxl.styles.Font(bold=True)
-
-    # Preparar respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    filename = f"reporte_ventas_{start_date}_a_{end_date}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    wb.save(response)
-    return response
+@staff_member_required
+def sales_report_rows_view(request):
+    """Siguiente página de filas del reporte (botón "Cargar más" con HTMX)"""
+    try:
+        start_date = datetime.strptime(request.GET.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.GET.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponse("Formato de fecha inválido", status=400)
 
+    sales, next_cursor = sales_page(sales_in_range(start_date, end_date), request.GET.get('after'))
+    return render(request, 'pos/partials/sales_report_rows.html', {
+        'sales': sales,
+        'next_cursor': next_cursor,
+        'start_date': start_date,
+        'end_date': end_date,
+        'show_session': bool(request.GET.get('session')),
+    })
 
-def generate_pdf_report(sales, start_date, end_date):
-    """Generar reporte en formato PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=30)
-    elements = []
-
-    # Estilos
-    styles = getSampleStyleSheet()
-
-    # Título
-    title = Paragraph(f"<b>Reporte de Ventas</b><br/>Período: {start_date} a {end_date}", styles['Heading2'])
-    elements.append(title)
-    elements.append(Paragraph("<br/>", styles['Normal']))
-
-    # Datos de resumen
-    total_sales = sum(sale.total_amount for sale in sales)
-    total_transactions = len(sales)
-
-    summary_data = [
-        ["Total de Ventas:", f"${total_sales:.2f}"],
-        ["Total de Transacciones:", str(total_transactions)],
-        ["Período:", f"{start_date} a {end_date}"]
-    ]
-
-    summary_table = Table(summary_data, colWidths=[150, 100])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5C5CBD')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#e9ecef')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(summary_table)
-    elements.append(Paragraph("<br/><br/>", styles['Normal']))
-
-    # Tabla de ventas detalladas
-    if sales:
-        data = [['ID', 'Fecha', 'Vendedor', 'Método', 'Total']]
-
-        for sale in sales:
-            vendedor = "N/A"
-            if sale.cash_drawer_session and sale.cash_drawer_session.user:
-                vendedor = sale.cash_drawer_session.user.username
-
-            metodo = 'Efectivo' if sale.payment_method == 'cash' else 'Tarjeta'
-
-            data.append([
-                str(sale.id),
-                sale.created_at.strftime('%d/%m/%Y %H:%M'),
-                vendedor,
-                metodo,
-                f"${sale.total_amount:.2f}"
-            ])
-
-        # Añadir fila de total
-        data.append(['', '', '', 'TOTAL:', f"${total_sales:.2f}"])
-
-        table = Table(data, colWidths=[50, 80, 80, 60, 60])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5C5CBD')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#f8f9fa')),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e9ecef')),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-
-    # Construir PDF
-    doc.build(elements)
-
-    # Preparar respuesta
-    response = HttpResponse(content_type='application/pdf')
-    filename = f"reporte_ventas_{start_date}_a_{end_date}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
 
-    return response
+@staff_member_required
+def report_job_status_view(request, job_id):
+    """Estado de un reporte en segundo plano (la página consulta este fragmento con HTMX)"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    template = 'pos/partials/report_job_status.html' if request.htmx else 'pos/report_job.html'
+    return render(request, template, {'job': job})
+
+
+@staff_member_required
+def report_job_download_view(request, job_id):
+    """Descarga el archivo generado"""
+    job = get_object_or_404(ReportJob, id=job_id, status='done')
+    if not os.path.exists(job.file_path):
+        messages.error(request, "❌ El archivo del reporte ya no existe, vuelve a exportarlo")
+        return redirect('sales_report')
+    return report_file_response(job)
+
+
+@staff_member_required
+def margin_report_view(request):
+    """Margen bruto por producto, categoría y proveedor usando el costo de cada venta"""
+    report = None
+    start_date = None
+    end_date = None
+
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    if start_date_str and end_date_str:
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            report = margin_report(start_date, end_date)
+        except ValueError:
+            messages.error(request, "Formato de fecha inválido")
+
+    return render(request, 'pos/margin_report.html', {
+        'report': report,
+        'start_date': start_date,
+        'end_date': end_date,
+    })
 
 
 @login_required
@@ -684,28 +537,22 @@ def returns_main_view(request):
 
 @login_required
 def search_sale_for_return_view(request):
-    """Buscar venta para devolución"""
+    """Buscar venta para devolución por código de recibo escaneado o por ID"""
     sale_id = request.GET.get('sale_id', '').strip()
-    sale = None
-    error = None
+    if not sale_id:
+        return render(request, 'pos/partials/sale_return_details.html', {})
 
-    if sale_id:
-        try:
-            sale = Sale.objects.select_related(
-                'customer',
-                'cash_drawer_session',
-                'cash_drawer_session__user'
-            ).prefetch_related('items').get(id=sale_id)
-        except Sale.DoesNotExist:
-            error = f"❌ No se encontró la venta #{sale_id}"
-        except ValueError:
-            error = "❌ ID de venta inválido"
+    try:
+        html = return_details_html(*parse_sale_lookup(sale_id))
+    except ValueError:
+        html = None
+        error = "❌ Código de recibo o ID de venta inválido"
+    else:
+        error = f"❌ No se encontró la venta {sale_id}"
 
-    return render(request, 'pos/partials/sale_return_details.html', {
-        'sale': sale,
-        'error': error,
-        'sale_id': sale_id
-    })
+    if html is None:
+        return render(request, 'pos/partials/sale_return_details.html', {'error': error})
+    return HttpResponse(html.replace(CSRF_SLOT, csrf_input(request)))
 
 
 @login_required
@@ -713,76 +560,30 @@ def search_sale_for_return_view(request):
 def process_return_view(request):
     """Procesar la devolución"""
     if request.method == 'POST':
-        sale_id = request.POST.get('sale_id')
-        reason = request.POST.get('reason', '')
-
         try:
-            sale = Sale.objects.get(id=sale_id)
-
-            # Crear la devolución
-            sale_return = SaleReturn.objects.create(
-                original_sale=sale,
-                reason=reason,
-                processed_by=request.user
+            sale = Sale.objects.get(id=request.POST.get('sale_id'))
+            sale_return = process_return(
+                sale,
+                parse_return_quantities(request.POST),
+                request.user,
+                reason=request.POST.get('reason', '')
             )
+            transaction.on_commit(invalidate_dashboard_metrics)
+            transaction.on_commit(publish_snapshot)
 
-            total_refund = 0
-            return_items = []
-
-            # Procesar cada item devuelto
-            for key, value in request.POST.items():
-                if key.startswith('return_qty_'):
-                    item_id = key.replace('return_qty_', '')
-                    return_qty = int(value)
-
-                    if return_qty > 0:
-                        try:
-                            sale_item = SaleItem.objects.get(id=item_id, sale=sale)
-
-                            # Validar que no se devuelva más de lo comprado
-                            if return_qty <= sale_item.quantity:
-                                # Crear item de devolución
-                                return_item = SaleReturnItem(
-                                    return_request=sale_return,
-                                    product=sale_item.product,
-                                    quantity=return_qty,
-                                    unit_price=sale_item.unit_price
-                                )
-                                return_items.append(return_item)
-
-                                # Revertir stock
-                                product = sale_item.product
-                                product.stock += return_qty
-                                product.save()
-
-                                # Calcular reembolso
-                                total_refund += return_qty * sale_item.unit_price
-                            else:
-                                messages.error(request,
-                                               f"No se puede devolver más de {sale_item.quantity} unidades de {sale_item.product_name}")
-                                return redirect('returns_main')
-
-                        except SaleItem.DoesNotExist:
-                            messages.error(request, "Item de venta no encontrado")
-                            return redirect('returns_main')
-
-            # Guardar todos los items de devolución
-            if return_items:
-                SaleReturnItem.objects.bulk_create(return_items)
-                sale_return.total_refund = total_refund
-                sale_return.save()
-
-                messages.success(request, f"✅ Devolución procesada exitosamente. Reembolso: ${total_refund:.2f}")
-                return redirect('returns_main')
-            else:
-                messages.error(request, "❌ No se seleccionaron productos para devolver")
-                return redirect('returns_main')
+            messages.success(
+                request, f"✅ Devolución procesada exitosamente. Reembolso: ${sale_return.total_refund:.2f}"
+            )
+            return redirect('returns_main')
 
-        except Sale.DoesNotExist:
+        except (Sale.DoesNotExist, ValueError):
             messages.error(request, "Venta no encontrada")
             return redirect('returns_main')
+        except ReturnError as e:
+            messages.error(request, f"❌ {e}")
+            return redirect('returns_main')
         except Exception as e:
             messages.error(request, f"Error al procesar devolución: {str(e)}")
             return redirect('returns_main')
 
-    return redirect('returns_main')
\ No newline at end of file
+    return redirect('returns_main')
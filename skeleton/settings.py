@@ -31,13 +31,14 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    # Antes que el admin para que sus plantillas admin/* tengan prioridad
+    'pos',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'pos',
 ]
 
 MIDDLEWARE = [
@@ -127,3 +128,42 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# POS
+# Caché de SKU por worker (ver pos/catalog.py)
+POS_SKU_CACHE_SIZE = 5000
+POS_SKU_CACHE_TTL = 60  # segundos
+# Índice de nombres/SKU del buscador de la caja (por worker); se reconstruye completo cada TTL
+POS_PRODUCT_INDEX_TTL = 300  # segundos
+
+# Segundos antes de volver a verificar en la BD la sesión de caja guardada en la sesión de login
+POS_CASH_SESSION_RECHECK = 60
+
+# Sub-contadores por producto con stock repartido (ver pos/stock.py)
+POS_STOCK_SHARDS = 8
+
+# Segundos entre compactaciones del libro de stock lanzadas por las ventas (0 = solo `compact_stock`)
+POS_STOCK_COMPACTION_INTERVAL = 60
+
+# 'sync': la venta se registra dentro de la petición.
+# 'queued': se guarda en CheckoutQueueEntry y `manage.py drain_checkout_queue` la registra.
+POS_CHECKOUT_MODE = 'sync'
+
+# Segundos que se reutilizan las métricas de los dashboards (se invalidan en cada venta/devolución)
+POS_DASHBOARD_CACHE_TTL = 15
+
+# Segundos que se reutiliza el fragmento de una venta en la pantalla de devoluciones (se borra al devolver)
+POS_RETURN_FRAGMENT_TTL = 120
+
+# Segundos sin eventos tras los que el stream SSE del dashboard reenvía la foto de la caché de métricas
+# (mantiene viva la conexión y recoge ventas de otros workers; servir con ASGI, p. ej. uvicorn skeleton.asgi:application)
+POS_DASHBOARD_STREAM_KEEPALIVE = 15
+
+# 'queued': se encola en ReportJob y `manage.py run_report_jobs --loop` la genera en un pool de procesos.
+# 'sync': la exportación se genera dentro de la petición (solo para desarrollo y tests: bloquea el worker web).
+POS_REPORT_MODE = 'queued'
+POS_REPORTS_DIR = BASE_DIR / 'report_files'
+
+# Segundos tras los que un reporte 'Generando' se da por abandonado y vuelve a la cola
+POS_REPORT_JOB_TIMEOUT = 600